@@ -0,0 +1,68 @@
+"""---------------------------------------------------------------------
+Aggregation of raster strips for qgis2urscape.py (CheckLayer.aggregateAndSum).
+Worker processes import this module only, so it must not import QGIS:
+importing qgis2urscape would start QGIS Processing in every worker
+---------------------------------------------------------------------"""
+from osgeo import gdal
+import math, numpy
+
+def readAsFloat(band, xOff, yOff, xSize, ySize, dtype='float'):
+    """ Read band window as floats (always translate everything to float) with
+    the noData value of the band as NaN, virtual rasters from processNoData
+    keep the original values and are remapped here"""
+    inData = band.ReadAsArray(xOff, yOff, xSize, ySize)
+    data = numpy.array(inData, dtype=dtype)
+    noData = band.GetNoDataValue()
+    if noData is not None and not math.isnan(noData):
+        data[inData == noData] = float('nan') # compared before the conversion to working precision
+    return data
+
+def aggregateStrip(rasterPath, bandIndex, rows, cols, mode, dtype):
+    """ Read the strip of input rows needed by a block of output rows and
+    aggregate it. Runs in worker processes, so it only depends on GDAL and numpy.
+    Values are kept in working precision, sums are accumulated as float64 weights"""
+    rowIndex, rowWindow, rowKm, rowRatio = rows
+    inFromY = int(rowIndex.min())
+    inToY = int(rowIndex.max()) + 1
+
+    inRaster = gdal.Open(rasterPath, gdal.GA_ReadOnly)
+    inBand = inRaster.GetRasterBand(bandIndex)
+    inData = readAsFloat(inBand, 0, inFromY, inRaster.RasterXSize, inToY - inFromY, dtype)
+
+    return aggregateRows(inData, (rowIndex - inFromY, rowWindow, rowKm, rowRatio), cols, mode).astype(dtype)
+
+def aggregateRows(inData, rows, cols, mode):
+    """ Aggregate block of output rows using separable weights: first the
+    intersecting input rows are reduced, then the intersecting columns"""
+    rowIndex, rowWindow, rowKm, rowRatio = rows
+    colIndex, colWindow, colKm, colRatio = cols
+    isRelative, summary, unitsMultiply, convertNoData = mode
+
+    def reduceColumns(rowValues, colWeights):
+        return (rowValues[:, colIndex] * colWeights).sum(axis=2)
+
+    data = inData[rowIndex]
+    isValid = ~numpy.isnan(data) & rowWindow[:, :, None]
+    values = numpy.where(isValid, data, 0)
+
+    validCount = reduceColumns(isValid.sum(axis=1), colWindow)
+    windowCount = rowWindow.sum(axis=1)[:, None] * colWindow.sum(axis=1)[None, :]
+
+    # Finally assign the aggregated average values or summarized values
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        if isRelative:
+            outValues = reduceColumns(numpy.einsum('bk,bkx->bx', rowKm, values), colKm)
+            if summary:
+                outValues = outValues * unitsMultiply
+        else:
+            outValues = reduceColumns(numpy.einsum('bk,bkx->bx', rowRatio, values), colRatio)
+            if not summary:
+                aggregatedRatio = reduceColumns(numpy.einsum('bk,bkx->bx', rowRatio, isValid), colRatio)
+                outValues = outValues / aggregatedRatio
+
+    # noData is written if all cells are noData or if any cell is noData (when not converting)
+    isNoData = validCount == 0
+    if not convertNoData:
+        isNoData |= validCount < windowCount
+    outValues[isNoData] = float("nan")
+    return outValues
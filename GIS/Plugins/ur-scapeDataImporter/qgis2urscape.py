@@ -36,6 +36,8 @@ resamplingMethod = 0 # 0 Nearest neighbor, 1 Bilinear, 5 average, 7 Maximum, 8 m
 activeGeometryFix = False
 convertNoData = False  # False will output noData (default); True will ignore the cell for aggregation
 clipToNoData = False
+pointStatistic = "mean" # value of cells for non-categorized points: "count", "sum", "mean", "min" or "max" of the point values
+outputFormat = "csv" # "csv" for UTF-16 text patches and csv graphs, "bin" for ur-scape binary patches and graphs (ignored for municipal budget)
 #version for indonesia
 """
 networkMap ={"Highway":["Tol"],\
@@ -62,12 +64,31 @@ unitsMultiply=[ 1 , 1 , 1 , 1 , 1 , 100 , 1 , 100 ] # difference for relative nu
 colorHSV = None
 debuggingMode = False
 onlyYear = False
+writeBlockSize = 1000000 # number of grid cells formatted and written to the file at once
+aggregationBlockSize = 10000000 # number of input cells read and aggregated at once (limits memory use)
+aggregationWorkers = 1 # number of processes used for aggregation (1 = aggregate in QGIS process)
+readBlockSize = 10000000 # number of raster cells read at once when scanning whole rasters
+featureBatchSize = 100000 # number of vector features read into arrays at once
+exportWorkers = 1 # number of patches read and written at once (threads)
+workingPrecision = "Float32" # "Float32" or "Float64" for intermediate rasters and arrays (category and municipal budget data always use Float64). Float32 keeps about 7 significant digits (relative error up to 2^-23)
+inMemoryPipeline = False # keep intermediate rasters in GDAL memory (/vsimem/) instead of the temp folder
+inMemoryLimitMb = 1024 # intermediate rasters are written to the temp folder once the memory ones would exceed this size
+warpResampling = ['near', 'bilinear', 'cubic', 'cubicspline', 'lanczos', 'average', 'mode', 'max', 'min', 'med', 'q1', 'q3'] # RESAMPLING of gdal:warpreproject for in-memory warps
+tempCompression = "ZSTD" # compression of temp GeoTIFFs: "ZSTD" (DEFLATE if GDAL is built without it), "DEFLATE" or "NONE", smaller files for CPU time (see test/benchmark_temp_rasters.py)
+tempBlockSize = 256 # tile size of temp GeoTIFFs
+performanceProfile = False # True warps with all CPUs, memory from available RAM and tiled, compressed outputs (ZSTD or tempCompression)
+performanceMemoryShare = 0.25 # share of available RAM used for warp memory and GDAL cache (performance profile)
+virtualNoData = True # set a single noData value on a virtual raster (VRT) instead of writing a Float64 copy with NaN
+binToken = 0x600DF00D # must match PatchDataIO.BIN_TOKEN in ur-scape
+binVersion = 13 # must match PatchDataIO.BIN_VERSION in ur-scape
+binDistributionSize = 50 # must match GridData.DefaultDistributionSize in ur-scape
 
 """---------------------------------------------------------------------
 You can't touch this
 ---------------------------------------------------------------------"""
-from osgeo import ogr, gdal, osr
-import os, sys, processing, csv, math, colorsys,traceback,numpy,datetime,numbers,shutil 
+from osgeo import ogr, gdal, osr, gdal_array
+import os, sys, processing, csv, math, colorsys,traceback,numpy,datetime,numbers,shutil,struct,pickle 
+import concurrent.futures, multiprocessing, multiprocessing.spawn, contextlib
 from tempfile import mkstemp
 from osgeo.gdalconst import *
 from qgis.core import (QgsProject
@@ -77,11 +98,18 @@ from qgis.core import (QgsProject
                       ,QgsRectangle
                       ,QgsProcessingUtils
                       ,QgsVectorLayer
+                      ,QgsFeatureRequest
                       ,QgsRasterLayer
                       )
 from qgis.utils import iface
 from PyQt5.QtCore import QFileInfo
 from processing.core.Processing import Processing
+try:
+    from .aggregation import readAsFloat, aggregateStrip
+except ImportError: # not imported as part of the plugin package (QGIS console or tests)
+    if '__file__' in globals():
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from aggregation import readAsFloat, aggregateStrip
 isPlugin = (__name__ != '__console__')
 
 # Disable exceptions if needed for QGIS 3.34 and other versions
@@ -143,6 +171,9 @@ class Setup:
     def isCanceledAndUpdateProgress(self, progress):
         if self.task is not None:
             self.task.setProgress(progress)
+        return self.isCanceled()
+
+    def isCanceled(self):
         return self.task is not None and self.task.isCanceled()
 
     def defineUnits(self):
@@ -190,6 +221,13 @@ class Setup:
     def hasProblem(self):
         return  self.secondaryCheck(self.problem)
         
+    def getWorkingPrecision(self):
+        """ GDAL data type and numpy dtype of intermediate rasters and arrays,
+        category ids and municipal budget values are always kept as Float64"""
+        if workingPrecision == "Float64" or forMunicipalBudget or (self.isCategorized and not self.isPoint):
+            return gdal.GDT_Float64, 'f8'
+        return gdal.GDT_Float32, 'f4'
+
     def getFieldCat(self):
         fieldCat =  "catID" if self.isCategorized  else field
         return fieldCat
@@ -334,31 +372,38 @@ class Setup:
         if debuggingMode:
             QgsProject.instance().addMapLayer(catLayer) # adding to canvas
     
-        """ check for all categories in dataset"""
-        categories = []
-        for feature in catLayer.getFeatures():
-            cleanRecord = self.cleanCategoryString(feature[field])
-            if not cleanRecord in categories:
-                categories.append(cleanRecord)
-        categories.sort()  
+        """ check for all categories in dataset, categories depend only on the
+        text of the field so each distinct text is cleaned once"""
+        reader = FeatureReader(catLayer, field)
+        cleanRecords = {}
+        for ids, values, xs, ys in reader.batches():
+            for value in values:
+                rawRecord = str(value)
+                if not rawRecord in cleanRecords:
+                    cleanRecords[rawRecord] = self.cleanCategoryString(value)
+        categories = sorted(set(cleanRecords.values()))
+        categoryIds = {category: i + 1 for i, category in enumerate(categories)}
         
         """ write categories"""
-        catLayer.startEditing()
-        for feature in catLayer.getFeatures():  
-            cleanRecord = self.cleanCategoryString(feature[field])
-            categoryId = categories.index(cleanRecord)
-            colId = feature.fieldNameIndex("catID") 
-            catLayer.changeAttributeValue(feature.id(),colId, categoryId+1)
+        colId = catLayer.fields().indexOf("catID")
+        provider = catLayer.dataProvider()
+        checkedRecords = set()
+        for ids, values, xs, ys in reader.batches():
+            rawRecords = [str(value) for value in values]
+            provider.changeAttributeValues({int(fid): {colId: categoryIds[cleanRecords[rawRecord]]} for fid, rawRecord in zip(ids, rawRecords)})
            
             """mask out if noDataValue same as category name"""
-            if noDataList is not None:
-                if str(feature[field]) in noDataList and not categoryId+1 in self.noDataList:
-                    self.noDataList.append(categoryId+1)
-            if noDataValue is not None:
-                if str(feature[field]) == noDataValue and not categoryId+1 in self.noDataList:
-                    self.noDataList.append(categoryId+1)
-
-        catLayer.commitChanges()
+            for rawRecord in rawRecords:
+                if rawRecord in checkedRecords:
+                    continue
+                checkedRecords.add(rawRecord)
+                categoryId = categoryIds[cleanRecords[rawRecord]]
+                if noDataList is not None:
+                    if rawRecord in noDataList and not categoryId in self.noDataList:
+                        self.noDataList.append(categoryId)
+                if noDataValue is not None:
+                    if rawRecord == noDataValue and not categoryId in self.noDataList:
+                        self.noDataList.append(categoryId)
     
         if len(categories)>128 and not forMunicipalBudget:
             print ("WARNING! You are using more than 128 categories. ur-scape won't show this correctly.")
@@ -589,6 +634,43 @@ class LayerWriter:
                         print("A layer with the same name but different colours already exists in the file: Layers.csv. The colour you have chosen will be ignored.")
                         print("You can change the colour for all data layers with this name in the ur-scape application using the Manage Data panel.")
 
+class PatchBand:
+    "Values of one patch window, read from the raster one block of rows at a time"
+
+    def __init__(self, raster, window, countX, countY, geoTransform, dtype):
+        self.raster = raster
+        self.window = window # pixel window of the patch in the raster
+        self.countX = countX
+        self.countY = countY
+        self.geoTransform = geoTransform
+        self.dtype = dtype # working precision of the values
+
+    def blocks(self):
+        """ yield first row, float values and mask (True for noData) of each
+        block of rows, at most writeBlockSize cells are held at once"""
+        ds = gdal.Open(self.raster, GA_ReadOnly)
+        band = ds.GetRasterBand(useBand)
+        xOff, yOff, xSize, ySize = self.window
+        rowsPerBlock = max(1, int(writeBlockSize / max(1, xSize)))
+        for yStart in range(0, ySize, rowsPerBlock):
+            window = (xOff, yOff + yStart, xSize, min(rowsPerBlock, ySize - yStart))
+            values = self.readWindow(band, window, ds.RasterXSize, ds.RasterYSize)
+            yield yStart, values, ~numpy.isfinite(values)
+
+    def readWindow (self, band, window, xCount, yCount):
+        """ read pixel window directly from the band, cells outside of the
+        raster are 0 as in the clipped raster"""
+        xOff, yOff, xSize, ySize = window
+        xFrom, yFrom = max(xOff, 0), max(yOff, 0)
+        xTo, yTo = min(xOff + xSize, xCount), min(yOff + ySize, yCount)
+        if xFrom == xOff and yFrom == yOff and xTo == xOff + xSize and yTo == yOff + ySize:
+            return readAsFloat(band, xOff, yOff, xSize, ySize, self.dtype)
+
+        data = numpy.zeros((ySize, xSize), dtype=self.dtype)
+        if xTo > xFrom and yTo > yFrom:
+            data[yFrom - yOff:yTo - yOff, xFrom - xOff:xTo - xOff] = readAsFloat(band, xFrom, yFrom, xTo - xFrom, yTo - yFrom, self.dtype)
+        return data
+
 class FileWriter:
     "Create Csv File"
     
@@ -596,11 +678,15 @@ class FileWriter:
         if forReachability:
             """Create name for graph file"""
             dateCode = list(date)[-2] + list(date)[-1] if onlyYear else date.replace('.', '')
-            fileName = name + '_D_'+location+'_'+dateCode+ '_graph.csv'
+            fileName = name + '_D_'+location+'_'+dateCode+ '_graph.' + ('bin' if outputFormat == "bin" else 'csv')
             self.path = setup.finalPath+'/' +fileName
-            with open(self.path, 'w') as output_file:
-                #output_file.write("lenght;source;target;x1;y1;x2;y2;classification;WKT" + "\n") # for testing network in QGIS only
-                output_file.write("lenght,source,target,x1,y1,x2,y2,classification" + "\n")
+            if outputFormat == "bin":
+                """ links of all classes are kept and written at once by writeGraphToBin"""
+                self.graphEdges = []
+            else:
+                with open(self.path, 'w') as output_file:
+                    #output_file.write("lenght;source;target;x1;y1;x2;y2;classification;WKT" + "\n") # for testing network in QGIS only
+                    output_file.write("lenght,source,target,x1,y1,x2,y2,classification" + "\n")
 
             self.oldGraphData = None
             self.oldGraphVarify = None 
@@ -608,19 +694,43 @@ class FileWriter:
         else:    
 
             extents = self.getExtents(raster,setup) 
-            for i in range (0,len(extents)): 
-                if extents[i] is not None:
-                    rasterExtent = self.clipRaster(raster, extents[i],i,0)
-                    self.getBand(rasterExtent,setup)
-                    self.writeGridToFile(i,setup,extents[i])
-                else:
-                    print("Skipping the patch, because there is no data inside.")    
+            self.exportPatches(raster,setup,extents)
             
             if not forMunicipalBudget:
                 LayerWriter(name, group)
             print ("Data import complete. Have a good day!")
     
     
+    def exportPatches(self,raster,setup,extents):
+        """ Export each patch to its own file. Patches are independent, so with
+        exportWorkers > 1 several of them are read and encoded at once"""
+        def exportPatch(i):
+            if extents[i] is None:
+                print("Skipping the patch, because there is no data inside.")
+            elif not setup.isCanceled():
+                window = self.getPatchWindow(raster, extents[i])
+                patch = self.getBand(raster,setup,window)
+                if outputFormat == "bin" and not forMunicipalBudget:
+                    self.writeGridToBin(i,setup,extents[i],patch)
+                else:
+                    self.writeGridToFile(i,setup,extents[i],patch)
+
+        # municipal budget patches share one file name, so they are written in order
+        if exportWorkers > 1 and len(extents) > 1 and not forMunicipalBudget:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=exportWorkers) as executor:
+                futures = [executor.submit(exportPatch, i) for i in range(len(extents))]
+                for future in futures:
+                    future.result()
+                    if setup.isCanceled():
+                        for future in futures:
+                            future.cancel()
+                        break
+        else:
+            for i in range (0,len(extents)):
+                exportPatch(i)
+                if setup.isCanceled():
+                    break
+
     def getExtents(self,raster,setup):
         
         rlayer = QgsRasterLayer(raster, QFileInfo(raster).baseName())
@@ -698,100 +808,77 @@ class FileWriter:
                     if(xMaxE - xMinE) > trueRes and (yMaxE - yMinE) > trueRes:
                         extent = QgsRectangle (xMinE, yMinE, xMaxE, yMaxE)
                         index = index +1 # delete after testing noData clipping
-                        extent = self.ClipToNoData(raster, extent, setup)
-
                         extents.append (extent)
         else:
             extent = QgsRectangle (ex.xMinimum(), yMinCliped , ex.xMaximum(),yMaxCliped )
-            extent = self.ClipToNoData(raster, extent, setup)
             extents.append(extent)
 
+        """ clip patches to data, using one pass index of cells with data for all patches"""
+        if clipToNoData and not extentAsCanvas:
+            inRaster = gdal.Open(raster,GA_ReadOnly)
+            gt = inRaster.GetGeoTransform()
+            xCount, yCount = inRaster.RasterXSize, inRaster.RasterYSize
+            windows = [self.clampPixelWindow(self.getPixelWindow(extent, gt), xCount, yCount) for extent in extents]
+            noDataIndex = NoDataIndex(raster, windows, setup.getWorkingPrecision()[1])
+            extents = [self.ClipToNoData(raster, extent, setup, noDataIndex) for extent in extents]
+        else:
+            extents = [self.ClipToNoData(raster, extent, setup) for extent in extents]
+
         return extents
     
-    def clipRaster (self,rasterIn, extent, index, cat ):
-        
-        clipRaster = QgsProcessingUtils.tempFolder() + "/Clipped_raster.tif"
-        # processing.algorithmHelp('gdal:cliprasterbyextent')
-        parameterClip = { 'INPUT': rasterIn,\
-                        'PROJWIN': extent,\
-                        'NODATA':0,\
-                        'OUTPUT': clipRaster}
-                            
-        processing.run('gdal:cliprasterbyextent', parameterClip)
-        """ one more resample to make sure Xcount and Y are alway same, e.g for municipal Budget"""
-    
-        if debuggingMode:
-            layerTesting = QgsRasterLayer(clipRaster,"Clip Raster" + (str)(index))
-            QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas
-     
-        return clipRaster 
-    
-    def ClipToNoData(self, rasterIn, extent, setup):
+    def getPatchWindow (self,rasterIn, extent):
+        """ pixel window (xOff, yOff, xSize, ySize) of the patch, rounded in the
+        same way as gdal:cliprasterbyextent (gdal_translate -projwin)"""
+        gt = gdal.Open(rasterIn,GA_ReadOnly).GetGeoTransform()
+        xOff = int(math.floor((extent.xMinimum() - gt[0]) / gt[1] + 0.001))
+        yOff = int(math.floor((extent.yMaximum() - gt[3]) / gt[5] + 0.001))
+        xSize = int(math.floor((extent.xMaximum() - extent.xMinimum()) / gt[1] + 0.5))
+        ySize = int(math.floor((extent.yMinimum() - extent.yMaximum()) / gt[5] + 0.5))
+        return xOff, yOff, xSize, ySize
+
+    def ClipToNoData(self, rasterIn, extent, setup, noDataIndex=None):
         
         """return extent without Changes is clipNoData is not activated"""
         if not clipToNoData:
             return extent
         
-        """get input variables from raster"""
-        rasterIn = gdal.Open(rasterIn,GA_ReadOnly)
-        xCount,yCount = rasterIn.RasterXSize, rasterIn.RasterYSize
-        data = rasterIn.GetRasterBand(useBand).ReadAsArray(0, 0,  xCount,yCount)
-        gt = rasterIn.GetGeoTransform()
+        """get input variables from index or raster"""
+        if noDataIndex is None:
+            rasterIn = gdal.Open(rasterIn,GA_ReadOnly)
+            xCount,yCount = rasterIn.RasterXSize, rasterIn.RasterYSize
+            gt = rasterIn.GetGeoTransform()
+        else:
+            xCount,yCount = noDataIndex.countX, noDataIndex.countY
+            gt = noDataIndex.geoTransform
         xRasterMin, yRasterMin, width, height = gt[0], gt[3], gt[1], gt[5]
       
         """start and end index from min and max"""
-        xStart = int(math.floor(( extent.xMinimum()-xRasterMin )/width))
-        yStart = int(math.floor((extent.yMaximum()-yRasterMin )/height))
-        xEnd = int(math.floor(( extent.xMaximum()-xRasterMin )/width))
-        yEnd = int(math.floor((extent.yMinimum() -yRasterMin  )/height))
-        isItEmpty = True
-        
-        """ Check for first no data on X axis and save position to yStart"""
-        for y in range(yStart,yEnd ):
-            breakFromFirstLoop = False
-            for x in range(xStart, xEnd):
-                if not math.isnan(data[y,x]):
-                    yStart = y
-                    breakFromFirstLoop = True
-                    isItEmpty = False
-                    break
-            if breakFromFirstLoop:
-                break;        
-        """Shortcut: if yStart does not change it means that all of the dataset is NoData!"""
-        if isItEmpty:
+        xStart, yStart, xEnd, yEnd = self.getPixelWindow(extent, gt)
+        xFrom, yFrom, xTo, yTo = self.clampPixelWindow((xStart, yStart, xEnd, yEnd), xCount, yCount)
+        if xTo <= xFrom or yTo <= yFrom:
             return None
-                    
-        """ Check for first no data on Y axis and save position to xStart"""
-        for x in range(xStart, xEnd):
-            breakFromFirstLoop = False            
-            for y in range(yStart,yEnd ):
-                if not math.isnan(data[y,x]):
-                    xStart = x
-                    breakFromFirstLoop = True 
-                    break
-            if breakFromFirstLoop:
-                break;  
-
-        """ Check for last no data on X axis and save position to yEnd"""
-        for y in range(yEnd-1, yStart-1, -1):
-            breakFromFirstLoop = False            
-            for x in range(xEnd-1, xStart-1, -1):
-               if not math.isnan(data[y,x]):
-                    yEnd = y
-                    breakFromFirstLoop = True 
-                    break
-            if breakFromFirstLoop:
-                break;                      
-        """ Check for last no data on Y axis and save position to xEnd"""
-        for x in range(xEnd-1, xStart-1, -1):
-            breakFromFirstLoop = False 
-            for y in range(yEnd-1, yStart-1, -1):
-               if not math.isnan(data[y,x]):
-                    xEnd = x
-                    breakFromFirstLoop = True 
-                    break
-            if breakFromFirstLoop:
-                break;  
+
+        """rows with data and first row with data for each column (read only the patch window if no index)"""
+        if noDataIndex is None:
+            data = readAsFloat(rasterIn.GetRasterBand(useBand), xFrom, yFrom, xTo - xFrom, yTo - yFrom, setup.getWorkingPrecision()[1])
+            hasData = ~numpy.isnan(data)
+            rowHasData = hasData.any(axis=1)
+            colFirstRow = numpy.where(hasData.any(axis=0), hasData.argmax(axis=0), yTo - yFrom)
+        else:
+            rowHasData, colFirstRow = noDataIndex.getWindow(xFrom, yFrom, xTo, yTo)
+
+        """ first and last row with data, shortcut: no rows means all of the dataset is NoData!"""
+        rowsWithData = numpy.flatnonzero(rowHasData)
+        if rowsWithData.size == 0:
+            return None
+        yStart = yFrom + rowsWithData[0]
+        yEnd = yFrom + rowsWithData[-1]
+
+        """ first column with data, last column is searched above the last row with data"""
+        xStart = xFrom + numpy.flatnonzero(colFirstRow < yTo - yFrom)[0]
+        colsWithData = numpy.flatnonzero(colFirstRow < rowsWithData[-1])
+        if colsWithData.size > 0:
+            xEnd = xFrom + colsWithData[-1]
                 
         """update extent values"""
         eMinX = xRasterMin + xStart * width
@@ -802,8 +889,21 @@ class FileWriter:
         """tranclate extent to QGIS extent string format """ 
         extent = QgsRectangle (eMinX, eMinY, eMaxX , eMaxY )
         return extent
+
+    def getPixelWindow(self, extent, gt):
+        """ start and end index of cells from extent"""
+        xRasterMin, yRasterMin, width, height = gt[0], gt[3], gt[1], gt[5]
+        xStart = int(math.floor(( extent.xMinimum()-xRasterMin )/width))
+        yStart = int(math.floor((extent.yMaximum()-yRasterMin )/height))
+        xEnd = int(math.floor(( extent.xMaximum()-xRasterMin )/width))
+        yEnd = int(math.floor((extent.yMinimum() -yRasterMin  )/height))
+        return xStart, yStart, xEnd, yEnd
+
+    def clampPixelWindow(self, window, xCount, yCount):
+        xStart, yStart, xEnd, yEnd = window
+        return max(xStart, 0), max(yStart, 0), min(xEnd, xCount), min(yEnd, yCount)
     
-    def writeGridToFile(self,index,setup,extent):
+    def writeGridToFile(self,index,setup,extent,patch):
         """ get info about size and position"""
         minX,minY,maxX,maxY = self.getCleanExtent(setup,extent)
 
@@ -849,22 +949,13 @@ class FileWriter:
         output_file.write("North,"+str(minY)+ '\n')
         output_file.write("East,"+ str(maxX)+ '\n')
         output_file.write("South,"+ str(maxY)+ '\n')
-        output_file.write("Count X," + str(setup.countX)+ '\n')
-        output_file.write("Count Y," + str(setup.countY)+ '\n')
+        output_file.write("Count X," + str(patch.countX)+ '\n')
+        output_file.write("Count Y," + str(patch.countY)+ '\n')
         output_file.write("VALUE,MASK" + '\n')
-            
-        values, masks = setup.band.data, setup.band.mask
 
-        for y in range(0, setup.countY):
-            for x in range(0, setup.countX): 
-
-                if forMunicipalBudget: 
-                    value= "-1" if masks[y,x] or values[y,x] == "0" else values[y,x]
-                    output_file.write(value + "\n")
-                else:
-                    value = values[y,x] if not masks[y,x]  else "0"
-                    mask = "1" if not masks[y,x] else "0"
-                    output_file.write(value + "," + mask + "\n")
+        """ write values as blocks of rows, each block is formatted at once"""
+        for yStart, values, masks in patch.blocks():
+            self.writeValuesBlock(output_file, values, masks)
 
 
         print ("File patch "+ str(index)+" generated for " + location + ".")
@@ -872,6 +963,176 @@ class FileWriter:
         """ close all and delete working dir"""
         output_file.close()
     
+    def writeGridToBin(self,index,setup,extent,patch):
+        """ write patch in the binary layout read by GridDataIO.LoadBin (version 13)"""
+        minX,minY,maxX,maxY = self.getCleanExtent(setup,extent)
+
+        dateCode = list(date)[-2] + list(date)[-1] if onlyYear else date.replace('.', '')
+        sign ='_'+ resolutionSign[int(resolution)]+'_'
+        fileString = name+ sign +location+'@'+ str(index)+'_'+dateCode+ '_grid.bin'
+
+        isCategorized = setup.isCategorized and not setup.isPoint
+        categories = setup.categories if isCategorized else []
+
+        """ first pass over the blocks: value range, mask and unknown categories"""
+        minValue, maxValue = numpy.finfo('<f4').max, numpy.finfo('<f4').min
+        hasMask = False
+        unknownIds = []
+        for yStart, values, masks in patch.blocks():
+            hasMask = hasMask or bool(masks.any())
+            validValues = values[~masks].astype('<f4')
+            if isCategorized:
+                self.collectUnknownCategories(validValues, len(categories), unknownIds)
+            elif validValues.size > 0:
+                minValue = min(minValue, validValues.min())
+                maxValue = max(maxValue, validValues.max())
+
+        if isCategorized:
+            minValue, maxValue = 0.0, float(len(categories) - 1)
+
+        unitsString = ""
+        if not setup.isCategorized and setup.units.strip() and units != "Insert Units":
+            unitsString = setup.units
+
+        with open(setup.finalPath+'/' + fileString, 'wb') as output_file:
+            """ header (GridDataIO.WriteBinHeader) """
+            output_file.write(struct.pack('<II', binToken, binVersion))
+            output_file.write(struct.pack('<dddd', minX, maxX, minY, maxY))
+            output_file.write(struct.pack('<i', len(categories)))
+
+            """ properties (GridDataIO.WriteBinProperties) """
+            output_file.write(struct.pack('<ffii', minValue, maxValue, patch.countX, patch.countY))
+            output_file.write(self.binString(unitsString))
+            output_file.write(struct.pack('<B', 2)) # GridData.Coloring.Multi
+
+            metadata = self.getMetadataPairs()
+            output_file.write(struct.pack('<i', len(metadata)))
+            for key, value in metadata:
+                output_file.write(self.binString(key))
+                output_file.write(self.binString(value))
+
+            for i in range(len(categories)):
+                output_file.write(self.binString(str(categories[i])))
+                output_file.write(struct.pack('<i', i))
+
+            """ values, mask and distribution (GridDataIO.WriteBinValues), second
+            pass writes values (masked cells as 0 like in the csv) and mask of each block in place"""
+            count = patch.countX * patch.countY
+            valuesStart = output_file.tell()
+            maskStart = valuesStart + 4 * count + 1
+            # mask buffer size is always multiple of 4 (GridData.CreateMaskBuffer)
+            valuesEnd = maskStart + 4 * ((count + 3) // 4) if hasMask else maskStart
+            distribution = None
+            for yStart, values, masks in patch.blocks():
+                values = numpy.where(masks, 0, values).astype('<f4')
+                if isCategorized:
+                    values = self.remapCategoryValues(values, masks, len(categories), unknownIds)
+                else:
+                    blockDistribution = self.getDistribution(values[~masks], minValue, maxValue)
+                    distribution = blockDistribution if distribution is None else distribution + blockDistribution
+
+                output_file.seek(valuesStart + 4 * yStart * patch.countX)
+                output_file.write(values.tobytes())
+                if hasMask:
+                    output_file.seek(maskStart + yStart * patch.countX)
+                    output_file.write((~masks).astype(numpy.uint8).tobytes())
+
+            output_file.seek(valuesStart + 4 * count)
+            output_file.write(struct.pack('<?', hasMask))
+            if hasMask:
+                output_file.seek(maskStart + count)
+                output_file.write(bytes(valuesEnd - maskStart - count))
+
+            output_file.seek(valuesEnd)
+            if isCategorized:
+                output_file.write(struct.pack('<B', 0))
+            else:
+                if distribution is None:
+                    distribution = self.getDistribution(numpy.zeros(0, dtype='<f4'), minValue, maxValue)
+                output_file.write(struct.pack('<B', distribution.size))
+                output_file.write(distribution.astype('<i4').tobytes())
+                output_file.write(struct.pack('<i', distribution.max() if distribution.size else 0))
+
+        print ("File patch "+ str(index)+" generated for " + location + ".")
+
+    def getMetadataPairs(self):
+        """ same metadata as written to the METADATA section of the csv"""
+        def stringCleaner(string):
+            return string.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
+
+        metadata = [("Layer Name", name)]
+        if source.strip() and source != "Insert Source":
+            metadata.append(("Source", stringCleaner(source)))
+        if citation.strip() and citation != "Insert Citation":
+            key = "MandatoryCitation" if mandatoryCitation else "Citation"
+            metadata.append((key, stringCleaner(citation)))
+        if link.strip() and link != "Insert Link":
+            metadata.append(("Link", stringCleaner(link)))
+        return metadata
+
+    def binString(self, text):
+        """ encode string as .NET BinaryWriter does: 7 bit encoded length + utf-8"""
+        encoded = str(text).encode('utf-8')
+        length = len(encoded)
+        prefix = bytearray()
+        while length >= 0x80:
+            prefix.append((length & 0x7F) | 0x80)
+            length >>= 7
+        prefix.append(length)
+        return bytes(prefix) + encoded
+
+    def collectUnknownCategories(self, validValues, categoriesCount, unknownIds):
+        """ append ids outside of 1..n to unknownIds in order of appearance"""
+        ids = validValues.astype(numpy.int64)
+        unknown = ids[(ids < 1) | (ids > categoriesCount)]
+        if unknown.size > 0:
+            blockIds, firstIndex = numpy.unique(unknown, return_index=True)
+            for unknownId in blockIds[numpy.argsort(firstIndex)]:
+                if unknownId not in unknownIds:
+                    unknownIds.append(unknownId)
+
+    def remapCategoryValues(self, values, masks, categoriesCount, unknownIds):
+        """ categories are written as 1..n in the csv and remapped to 0..n-1 by
+        GridData.RemapCategories, unknown ids get -1, -2, ... in order of appearance"""
+        ids = values.astype(numpy.int64)
+        remapped = (ids - 1).astype('<f4')
+        unknown = ~masks & ((ids < 1) | (ids > categoriesCount))
+        for order, unknownId in enumerate(unknownIds):
+            remapped[unknown & (ids == unknownId)] = -(order + 1)
+        return numpy.where(masks, values, remapped).astype('<f4')
+
+    def getDistribution(self, validValues, minValue, maxValue):
+        """ histogram computed as GridData.UpdateDistribution does on csv load,
+        histograms of blocks with the same range can be added"""
+        if minValue > maxValue:
+            return numpy.zeros(binDistributionSize, dtype=numpy.int64)
+
+        distributionSize = binDistributionSize
+        valueRange = 1 + int(maxValue - minValue)
+        if 2 < valueRange <= 20 and minValue == math.floor(minValue) and maxValue == math.floor(maxValue):
+            distributionSize = valueRange
+
+        invValueRange = numpy.float32(0)
+        if abs(maxValue - minValue) > 0.0001:
+            invValueRange = numpy.float32(distributionSize - 1) / numpy.float32(maxValue - minValue)
+
+        chartIndex = ((validValues - numpy.float32(minValue)) * invValueRange + numpy.float32(0.5)).astype(numpy.int64)
+        return numpy.bincount(chartIndex, minlength=distributionSize)[:distributionSize]
+
+    def writeValuesBlock(self, output_file, values, masks):
+        """ write VALUE,MASK rows (or VALUE rows for municipal budget) for a
+        block of float values with one write call, values are only formatted here"""
+        if forMunicipalBudget:
+            valueStrings = numpy.where(masks, 0, values).astype(int).astype(str)
+            lines = numpy.where(masks | (valueStrings == "0"), "-1", valueStrings)
+        else:
+            valueStrings = numpy.where(masks, "0", values.astype(str))
+            maskStrings = numpy.where(masks, "0", "1")
+            lines = numpy.char.add(numpy.char.add(valueStrings, ","), maskStrings)
+
+        if lines.size > 0:
+            output_file.write("\n".join(lines.ravel().tolist()) + "\n")
+
     def appendGraphFile(self,rasterMain, rasterVarify, feature):
 
         """ Get rasters and transformation information"""
@@ -895,118 +1156,220 @@ class FileWriter:
         power = list(reversed(list(networkMap.keys()))).index(feature)
         cl = str(2 ** power) # class is defined as incremental order of 1,2,4,8,16
         
-        """if first time, then make header and overwrite old file"""
-        output_file = open(self.path , 'a')
-
-        """Metrix to check TopLeft, Top, TopRight, Left Cell"""
+        """Metrix to check TopLeft, Top, TopRight, Left Cell, with three sub cells
+        of the 3X3 verify raster (row, column from the top left sub cell) for each"""
         metrix = [[-1, -1], [-1,0], [-1,1], [0,-1]] 
-        isOldValue = [False,False,False,False]
-        """ Check each cell and write nod if meet condition, skip edges rows and columns""" 
-        for y in range(1, countY):
-            for x in range(1, countX-1):
-                isValue =  dataMain[y,x] > 0            
-
-                if isValue:
-                    """Get values to be writen as Source nod"""
-                    source = str(y*(countX)+x)
-                    halfW,halfH = w*0.5, h*0.5
-                    X1,Y1 = str(minX + w*x + halfW),str(minY + h*y + halfH)
-
-                    """ Get Values in next cells, Top Left, Top, Top Right, Left"""
-                    isOtherValue = [dataMain[y + m[0] , x+ m[1]]>0 for m in metrix]
-                    if self.oldGraphData is not None:
-                        isOldValue = [self.oldGraphData[y + m[0] , x+ m[1]]>0 for m in metrix]
-                
-                    if isOtherValue[0] or isOldValue[0]:
-                        dataCheck = dataVarify if isOtherValue[0] else self.oldGraphVarify
-                    
-                        edgeVarifyRD = dataCheck [(y-1)*3+2,(x-1)*3+2] > 0 
-                        edgeVarifyDM = dataCheck [(y)*3,(x-1)*3+2] > 0 
-                        edgeVarifyRM = dataCheck [(y-1)*3+2,(x)*3] > 0 
-
-                        if edgeVarifyRD or edgeVarifyDM or edgeVarifyRM or cl== "16":   
-                            """informations about Top Left nod"""
-                            target = str(y*countX-countX+x-1)
-                            X2, Y2 = str(minX + w*(x-1) + halfW),str(minY + h*(y-1)+ halfH)
-                            #output_file.write(str(lenghtDiagonal)+";"+source+";" + target+";"+X1+";"+Y1+";"+X2+";"+Y2 + ";"+ cl+";"+"LINESTRING ("+X1+" " +Y1+","+ X2+ " "+Y2+")" + "\n")
-                            output_file.write(str(lenghtDiagonal)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl+ "\n")
-                
-                    if isOtherValue[1] or isOldValue[1]:
-                        dataCheck = dataVarify if isOtherValue[1] else self.oldGraphVarify
-                        edgeVarifyLD = dataCheck [(y-1)*3+2,(x)*3+0] > 0 
-                        edgeVarifyMD = dataCheck [(y-1)*3+2,(x)*3+1] > 0 
-                        edgeVarifyRD = dataCheck [(y-1)*3+2,(x)*3+2] > 0 
-
-                        if edgeVarifyLD or edgeVarifyMD or edgeVarifyRD or cl== "16":   
-                            """ informations about Top nod"""
-                            target = str(y*countX-countX+x)
-                            X2, Y2 = str(minX + w*(x) + halfW),str(minY + h*(y-1)+ halfH)
-                            #output_file.write(str(lenght)+";"+source+";" + target+";"+X1+";"+Y1+";"+X2+";"+Y2 + ";"+ cl+";"+"LINESTRING ("+X1+" " +Y1+","+ X2+ " "+Y2+")" + "\n")
-                            output_file.write(str(lenght)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl+ "\n")
-                
-                    if isOtherValue[2] or isOldValue[2]:
-                        dataCheck = dataVarify if isOtherValue[2] else self.oldGraphVarify
-                        edgeVarifyLD = dataCheck [(y-1)*3+2,(x+1)*3+0] > 0 
-                        edgeVarifyMD = dataCheck [(y-1)*3+2,(x)*3+2] > 0 
-                        edgeVarifyLM = dataCheck [(y)*3+0,(x+1)*3+0] > 0 
-    
-                        if edgeVarifyLD or edgeVarifyMD or edgeVarifyLM or cl== "16":    
-                            """ informations about Top Right nod"""
-                            target = str(y*countX-countX+(x+1))
-                            X2, Y2 = str(minX + w*(x+1) + halfW),str(minY + h*(y-1)+ halfH)
-                            #output_file.write(str(lenghtDiagonal)+";"+source+";" + target+";"+X1+";"+Y1+";"+X2+";"+Y2 + ";"+ cl+";"+"LINESTRING ("+X1+" " +Y1+","+ X2+ " "+Y2+")" + "\n")
-                            output_file.write(str(lenghtDiagonal)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl+ "\n")
-                    if isOtherValue[3] or isOldValue[3]:
-                        dataCheck = dataVarify if isOtherValue[3] else self.oldGraphVarify
-                        edgeVarifyRT = dataCheck [(y)*3+0,(x-1)*3+2] > 0 
-                        edgeVarifyRM = dataCheck [(y)*3+1,(x-1)*3+2] > 0 
-                        edgeVarifyRD = dataCheck [(y)*3+2,(x-1)*3+2] > 0 
-                        if edgeVarifyRT or edgeVarifyRM or edgeVarifyRD or cl== "16": 
-                            """ informations about left  nod"""
-                            target = str(y*countX+(x-1))
-                            X2, Y2 = str(minX + w*(x-1) + halfW),str(minY + h*(y)+ halfH)
-                            #output_file.write(str(lenght)+";"+source+";" + target+";"+X1+";"+Y1+";"+X2+";"+Y2 + ";"+ cl+";"+"LINESTRING ("+X1+" " +Y1+","+ X2+ " "+Y2+")" + "\n")
-                            output_file.write(str(lenght)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl+ "\n")
+        verifyCells = [[[-1,-1], [0,-1], [-1,0]], [[-1,0], [-1,1], [-1,2]], [[-1,3], [-1,2], [0,3]], [[0,-1], [1,-1], [2,-1]]]
+        lenghts = [str(lenghtDiagonal), str(lenght), str(lenghtDiagonal), str(lenght)]
+
+        """ Check each cell and write nod if meet condition, skip edges rows and
+        columns: all cells y in 1..countY-1, x in 1..countX-2 are checked at once""" 
+        ys, xs = slice(1, countY), slice(1, max(1, countX - 1))
+        rowCount, colCount = max(0, countY - 1), max(0, countX - 2)
+
+        def neighbour(data, m):
+            return data[1 + m[0]:countY + m[0], 1 + m[1]:1 + m[1] + colCount]
+
+        def isVerified(data, d):
+            # strided slices pick the sub cells of all cells in the 3X3 raster
+            cells = [data[3 + c[0]:3 + c[0] + 3 * rowCount:3, 3 + c[1]:3 + c[1] + 3 * colCount:3] > 0 for c in verifyCells[d]]
+            return cells[0] | cells[1] | cells[2]
+
+        with numpy.errstate(invalid='ignore'):
+            isValue = dataMain[ys, xs] > 0
+            isEdge = numpy.zeros((rowCount, colCount, 4), dtype=bool)
+            for d in range(4):
+                """ Get values in next cells, verified in the raster of this class if
+                there is a value, else in the raster of the previous class"""
+                isOtherValue = neighbour(dataMain, metrix[d]) > 0
+                if self.oldGraphData is not None:
+                    isOldValue = neighbour(self.oldGraphData, metrix[d]) > 0
+                    isEdgeVerified = numpy.where(isOtherValue, isVerified(dataVarify, d), isVerified(self.oldGraphVarify, d))
+                else:
+                    isOldValue = numpy.zeros_like(isOtherValue)
+                    isEdgeVerified = isVerified(dataVarify, d)
+                isEdge[:, :, d] = isValue & (isOtherValue | isOldValue) & (isEdgeVerified | (cl == "16"))
+
+        """ edges in order of cells and directions, coordinates are computed
+        once for each row and column"""
+        y, x, d = numpy.nonzero(isEdge)
+        y, x = y + 1, x + 1
+        halfW,halfH = w*0.5, h*0.5
+        xValues = numpy.array([minX + w*i + halfW for i in range(countX)] or [0.0])
+        yValues = numpy.array([minY + h*i + halfH for i in range(countY)] or [0.0])
+        targetY = y + numpy.array([-1, -1, -1, 0])[d]
+        targetX = x + numpy.array([-1, 0, 1, -1])[d]
+
+        if outputFormat == "bin":
+            self.graphEdges.append((numpy.array(lenghts, dtype=float)[d], y*countX + x, targetY*countX + targetX,
+                                    xValues[x], yValues[y], xValues[targetX], yValues[targetY], numpy.full(d.size, int(cl))))
+        else:
+            xStrings = numpy.array([str(v) for v in xValues.tolist()])
+            yStrings = numpy.array([str(v) for v in yValues.tolist()])
+            columns = [numpy.array(lenghts)[d], (y*countX + x).astype(str), (targetY*countX + targetX).astype(str),
+                       xStrings[x], yStrings[y], xStrings[targetX], yStrings[targetY], numpy.full(d.size, cl)]
+            lines = columns[0]
+            for column in columns[1:]:
+                lines = numpy.char.add(numpy.char.add(lines, ","), column)
+            if lines.size > 0:
+                with open(self.path , 'a') as output_file:
+                    output_file.write("\n".join(lines.tolist()) + "\n")
   
         self.oldGraphData = dataMain.copy()
         self.oldGraphVarify = dataVarify.copy()
 
-        output_file.close()      
+    def writeGraphToBin(self):
+        """ write graph in the binary layout read by GraphDataIO.LoadBin, with nodes
+        and links as GraphDataIO.ParseCsv builds them from the csv graph"""
+        if not self.graphEdges or sum(edges[0].size for edges in self.graphEdges) == 0:
+            print ("No road links found. The graph file was not written.")
+            return
+        lenghts, sources, targets, x1, y1, x2, y2, classes = [numpy.concatenate(column) for column in zip(*self.graphEdges)]
+        self.graphEdges = []
+
+        """ highway is on its own layer, its nodes have negative ids"""
+        isHighway = classes >= 16
+        sources = numpy.where(isHighway, -sources, sources)
+        targets = numpy.where(isHighway, -targets, targets)
+        isLink = sources != targets
+        lenghts, sources, targets, x1, y1, x2, y2, classes = [column[isLink] for column in (lenghts, sources, targets, x1, y1, x2, y2, classes)]
+        distances = lenghts.astype('<f4')
+
+        """ nodes in order of first appearance, source before target of each link,
+        with classifications of all their links merged"""
+        ids = numpy.column_stack((sources, targets)).ravel()
+        uniqueIds, first, inverse = numpy.unique(ids, return_index=True, return_inverse=True)
+        order = numpy.argsort(first)
+        nodeOfUnique = numpy.empty_like(order)
+        nodeOfUnique[order] = numpy.arange(order.size)
+        nodeCount = order.size
+        linkNodes = nodeOfUnique[inverse.ravel()].reshape(-1, 2)
+        nodeX = numpy.column_stack((x1, x2)).ravel()[first[order]]
+        nodeY = numpy.column_stack((y1, y2)).ravel()[first[order]]
+        nodeClass = numpy.zeros(nodeCount, dtype=numpy.int32)
+        numpy.bitwise_or.at(nodeClass, linkNodes.ravel(), numpy.repeat(classes, 2).astype(numpy.int32))
+
+        """ cell size is the smallest step between linked nodes (9e-6 is ~1 meter)"""
+        stepX, stepY = numpy.abs(x2 - x1), numpy.abs(y2 - y1)
+        cellSizeX = stepX[stepX > 0.00001].min() if (stepX > 0.00001).any() else sys.float_info.max
+        cellSizeY = stepY[stepY > 0.00001].min() if (stepY > 0.00001).any() else sys.float_info.max
+        west, east = nodeX.min() - cellSizeX * 0.5, nodeX.max() + cellSizeX * 0.5
+        north, south = nodeY.max() + cellSizeY * 0.5, nodeY.min() - cellSizeY * 0.5
+
+        """ node index is its cell in the grid, negative for highway nodes"""
+        kX, kY = 1.0 / cellSizeX, 1.0 / cellSizeY
+        gridCountX = int(round((east - west) * kX))
+        cellIndex = ((nodeX - west) * kX).astype(numpy.int64) + gridCountX * ((north - nodeY) * kY).astype(numpy.int64)
+        isHighwayNode = nodeClass == 16
+        nodeIndex = numpy.where(isHighwayNode, -cellIndex, cellIndex)
+        highwayCells = cellIndex[isHighwayNode][::-1]
+        highwayCells = highwayCells[numpy.sort(numpy.unique(highwayCells, return_index=True)[1])].tolist()
+        indexToNode = dict(zip(nodeIndex.tolist(), range(nodeCount)))
+
+        """ links of each node in the order they were added, both directions"""
+        linkCount = sources.size
+        owners = numpy.concatenate((linkNodes[:, 0], linkNodes[:, 1]))
+        sortLinks = numpy.lexsort((numpy.concatenate((numpy.arange(0, 2 * linkCount, 2), numpy.arange(1, 2 * linkCount, 2))), owners))
+        owners = owners[sortLinks]
+        others = numpy.concatenate((linkNodes[:, 1], linkNodes[:, 0]))[sortLinks]
+        linkDistances = numpy.concatenate((distances, distances))[sortLinks]
+        linkClasses = numpy.concatenate((classes, classes))[sortLinks]
+        linkStart = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(owners, minlength=nodeCount))))
+
+        """ connect highways to the other roads with highway link links, only
+        nodes touched by it are kept as python lists"""
+        editedLinks = {}
+        def getLinks(node):
+            if node not in editedLinks:
+                start, end = linkStart[node], linkStart[node + 1]
+                editedLinks[node] = [others[start:end].tolist(), linkDistances[start:end].tolist(), linkClasses[start:end].tolist()]
+            return editedLinks[node]
+
+        def addLinkData(node, other, distance, classification):
+            nodeLinks = getLinks(node)
+            for i in range(len(nodeLinks[0])):
+                if nodeLinks[0][i] == other and nodeLinks[2][i] == classification:
+                    nodeLinks[1][i] = min(distance, nodeLinks[1][i])
+                    return
+            nodeLinks[0].append(other)
+            nodeLinks[1].append(distance)
+            nodeLinks[2].append(classification)
+
+        def removeLinkData(node, other, classification):
+            nodeLinks = getLinks(node)
+            for i in range(len(nodeLinks[0]) - 1, -1, -1):
+                if nodeLinks[0][i] == other and nodeLinks[2][i] == classification:
+                    for values in nodeLinks:
+                        del values[i]
+                    return
+
+        isRemoved = numpy.zeros(nodeCount, dtype=bool)
+        for cell in highwayCells:
+            linkNode = indexToNode.get(cell)
+            if linkNode is None or nodeClass[linkNode] < 8:
+                continue
+            highwayNode = indexToNode[-cell]
+            nodeLinks = getLinks(linkNode)
+            for i in range(len(nodeLinks[0]) - 1, -1, -1):
+                if nodeLinks[2][i] == 8:
+                    other, distance = nodeLinks[0][i], nodeLinks[1][i]
+                    addLinkData(highwayNode, other, distance, 8)
+                    addLinkData(other, highwayNode, distance, 8)
+                    removeLinkData(linkNode, other, 8)
+                    removeLinkData(other, linkNode, 8)
+            if len(nodeLinks[0]) > 0:
+                nodeClass[linkNode] &= ~8
+            else:
+                isRemoved[linkNode] = True
+                del indexToNode[cell]
+
+        """ links are written once, from the node with the lower index (extra long
+        links are removed by GraphDataIO.LoadBin)"""
+        isEdited = numpy.zeros(nodeCount, dtype=bool)
+        isEdited[list(editedLinks)] = True
+        keep = ~isEdited[owners]
+        linkOrder = numpy.arange(owners.size) - linkStart[owners]
+        editedNodes = list(editedLinks)
+        editedCounts = [len(editedLinks[node][0]) for node in editedNodes]
+        owners = numpy.concatenate((owners[keep], numpy.repeat(numpy.array(editedNodes, dtype=owners.dtype), editedCounts)))
+        linkOrder = numpy.concatenate((linkOrder[keep], numpy.concatenate([numpy.arange(count) for count in editedCounts] or [[]]).astype(linkOrder.dtype)))
+        others = numpy.concatenate((others[keep], numpy.array([value for node in editedNodes for value in editedLinks[node][0]], dtype=others.dtype)))
+        linkDistances = numpy.concatenate((linkDistances[keep], numpy.array([value for node in editedNodes for value in editedLinks[node][1]], dtype='<f4')))
+        linkClasses = numpy.concatenate((linkClasses[keep], numpy.array([value for node in editedNodes for value in editedLinks[node][2]], dtype=linkClasses.dtype)))
+        sortLinks = numpy.lexsort((linkOrder, owners))
+        owners, others, linkDistances, linkClasses = owners[sortLinks], others[sortLinks], linkDistances[sortLinks], linkClasses[sortLinks]
+        isWritten = nodeIndex[others] > nodeIndex[owners]
+
+        nodes = numpy.zeros(nodeCount - int(isRemoved.sum()), dtype=[('x', '<f8'), ('y', '<f8'), ('classification', '<i4'), ('index', '<i4')])
+        nodes['x'], nodes['y'] = nodeX[~isRemoved], nodeY[~isRemoved]
+        nodes['classification'], nodes['index'] = nodeClass[~isRemoved], nodeIndex[~isRemoved]
+        links = numpy.zeros(int(isWritten.sum()), dtype=[('source', '<i4'), ('target', '<i4'), ('distance', '<f4'), ('classification', '<i4')])
+        links['source'], links['target'] = nodeIndex[owners[isWritten]], nodeIndex[others[isWritten]]
+        links['distance'], links['classification'] = linkDistances[isWritten], linkClasses[isWritten]
+
+        with open(self.path, 'wb') as output_file:
+            """ header (GraphDataIO.SaveBin) """
+            output_file.write(struct.pack('<II', binToken, binVersion))
+            output_file.write(struct.pack('<dddd', west, east, north, south))
+            output_file.write(struct.pack('<dd', cellSizeX, cellSizeY))
+            output_file.write(struct.pack('<i', nodes.size))
+            output_file.write(nodes.tobytes())
+            output_file.write(links.tobytes())
     
-    def getBand (self,raster,setup):
-        """ get values"""
+    def getBand (self,raster,setup,window):
+        """ get reader for the values of the patch window"""
         ds = gdal.Open(raster , GA_ReadOnly)
-        gt = ds.GetGeoTransform()
-        band = ds.GetRasterBand(useBand)
-        xCount,yCount = ds.RasterXSize,ds.RasterYSize
+        rasterGt = ds.GetGeoTransform()
+        xOff,yOff,xCount,yCount = window
+        gt = (rasterGt[0] + xOff * rasterGt[1], rasterGt[1], rasterGt[2], rasterGt[3] + yOff * rasterGt[5], rasterGt[4], rasterGt[5])
     
         """ for testing values """
         if debuggingMode:
             layerTesting = QgsRasterLayer(raster,"Raster for Band Extrapolation" )
             QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas
         
-        """ get masked array"""
-        bandDataAllTypes = band.ReadAsArray(0, 0, xCount, yCount)
-        bandData =  bandDataAllTypes.astype('float')
-
-
-        maskedData = numpy.ma.masked_values ( bandData,float('nan') )
-        maskedData = numpy.ma.masked_invalid(maskedData)
-        """Check if mask is array (noDataValue is not in dataset) and create if not"""
-
-        if type(maskedData.mask)== numpy.bool_:
-            maskedData.mask = numpy.ndarray(shape=(maskedData.data.size),dtype=bool)
-
-        if forMunicipalBudget:
-            dataInt = maskedData.astype(int)
-            data = dataInt.astype(str)
-        else:
-            data = maskedData.astype(str)
-
-        setup.band = data;
-        setup.countX = xCount
-        setup.countY = yCount
-        setup.geoTransform = gt
+        ds = None
+        return PatchBand(raster, window, xCount, yCount, gt, setup.getWorkingPrecision()[1])
 
     def getCleanExtent(self,setup,extent):
         if extentAsCanvas:
@@ -1025,7 +1388,6 @@ class FileWriter:
             scientificNotation =  '%E' % cellSizeInDegree
             ndigitsString  =  scientificNotation.split("-")[-1] 
             ndigits = int(float(ndigitsString ))
-            gt = setup.geoTransform
             
             minX=round(extent.xMinimum(),ndigits)
             minY=round(extent.yMinimum(),ndigits) if extent.yMinimum() < 85 else 85 # fixing maximal extent
@@ -1034,18 +1396,137 @@ class FileWriter:
 
         return minX,maxY,maxX,minY
       
+class NoDataIndex:
+    "One pass index of cells with data, used to clip patches without reading the raster again"
+
+    def __init__(self, rasterPath, windows, dtype='float'):
+        raster = gdal.Open(rasterPath, GA_ReadOnly)
+        self.countX, self.countY = raster.RasterXSize, raster.RasterYSize
+        self.geoTransform = raster.GetGeoTransform()
+        band = raster.GetRasterBand(useBand)
+
+        """ edges of patch windows split the raster into blocks"""
+        windows = [w for w in windows if w[2] > w[0] and w[3] > w[1]]
+        self.xBounds = numpy.unique([edge for w in windows for edge in (w[0], w[2])]).astype(int)
+        self.yBounds = numpy.unique([edge for w in windows for edge in (w[1], w[3])]).astype(int)
+
+        """ for each row if it has data inside block column and for each column
+        first row with data inside block row (countY if none)"""
+        self.rowHasData = numpy.zeros((self.countY, max(0, len(self.xBounds) - 1)), dtype=bool)
+        self.colFirstRow = numpy.full((max(0, len(self.yBounds) - 1), self.countX), self.countY, dtype=numpy.int64)
+        if len(windows) == 0:
+            return
+
+        xFrom, xTo = self.xBounds[0], self.xBounds[-1]
+        rowsPerRead = max(1, int(readBlockSize / max(1, xTo - xFrom)))
+        for yFrom in range(self.yBounds[0], self.yBounds[-1], rowsPerRead):
+            yTo = min(yFrom + rowsPerRead, self.yBounds[-1])
+            hasData = ~numpy.isnan(readAsFloat(band, int(xFrom), int(yFrom), int(xTo - xFrom), int(yTo - yFrom), dtype))
+
+            self.rowHasData[yFrom:yTo] = numpy.logical_or.reduceat(hasData, self.xBounds[:-1] - xFrom, axis=1)
+
+            for block in range(len(self.yBounds) - 1):
+                rowFrom = max(self.yBounds[block], yFrom)
+                rowTo = min(self.yBounds[block + 1], yTo)
+                if rowTo <= rowFrom:
+                    continue
+                blockData = hasData[rowFrom - yFrom:rowTo - yFrom]
+                firstRow = self.colFirstRow[block, xFrom:xTo]
+                isFirst = blockData.any(axis=0) & (firstRow == self.countY)
+                firstRow[isFirst] = rowFrom + blockData.argmax(axis=0)[isFirst]
+
+    def getWindow(self, xFrom, yFrom, xTo, yTo):
+        """ rows with data and first row with data for each column (relative to
+        window), the window has to be made from edges used to create the index"""
+        blockXFrom, blockXTo = numpy.searchsorted(self.xBounds, [xFrom, xTo])
+        blockYFrom, blockYTo = numpy.searchsorted(self.yBounds, [yFrom, yTo])
+        rowHasData = self.rowHasData[yFrom:yTo, blockXFrom:blockXTo].any(axis=1)
+        colFirstRow = self.colFirstRow[blockYFrom:blockYTo, xFrom:xTo].min(axis=0) - yFrom
+        return rowHasData, numpy.minimum(colFirstRow, yTo - yFrom)
+
+class FeatureReader:
+    "Read one field (and point coordinates) of vector features in batches of NumPy arrays"
+
+    def __init__(self, layer, fieldName, withPoints=False):
+        self.layer = layer
+        self.fieldName = fieldName
+        self.withPoints = withPoints
+
+    def getRequest(self):
+        """ request only the field, geometry is read only for points"""
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([self.fieldName], self.layer.fields())
+        if not self.withPoints:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        return request
+
+    def batches(self):
+        """ yield feature ids, field values (objects) and x, y coordinates of
+        points (None when not read) for every featureBatchSize features"""
+        ids, values, xs, ys = [], [], [], []
+        for feature in self.layer.getFeatures(self.getRequest()):
+            ids.append(feature.id())
+            values.append(feature[self.fieldName])
+            if self.withPoints:
+                xP,yP = feature.geometry().asPoint()
+                xs.append(xP)
+                ys.append(yP)
+            if len(ids) >= featureBatchSize:
+                yield self.toBatch(ids, values, xs, ys)
+                ids, values, xs, ys = [], [], [], []
+        if ids:
+            yield self.toBatch(ids, values, xs, ys)
+
+    def toBatch(self, ids, values, xs, ys):
+        batchValues = numpy.empty(len(values), dtype=object)
+        batchValues[:] = values
+        if not self.withPoints:
+            return numpy.array(ids, dtype=numpy.int64), batchValues, None, None
+        return numpy.array(ids, dtype=numpy.int64), batchValues, numpy.array(xs, dtype=float), numpy.array(ys, dtype=float)
+
+    def valuesAsFloat(self, values):
+        """ field values of a batch as floats, NULL values as NaN"""
+        def toFloat(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError): # NULL values
+                return float("nan")
+
+        return numpy.array([toFloat(value) for value in values], dtype=float)
+
 class CheckLayer:
     "Check what type of file is layer (Raster, Vector, Network, MunicipalBudget)"
     
     def __init__(self, setup):
-        if forReachability and setup.isVector: 
-            self.graphLayer (setup)
-        elif forMunicipalBudget and setup.isVector: 
-            self.municipalBudgetLayer(setup)
-        elif setup.isVector:     
-            self.standartVectorLayer(setup)
-        else:
-            self.standartRasterLayer(setup)    
+        self.memoryFiles = {} # size of the intermediate rasters in GDAL memory by path (in-memory pipeline)
+        self.memorySize = 0
+        self.reprojectedExtents = {} # extent layers reprojected to EPSG:4326, by layer id
+        self.warpParameters = self.getWarpParameters() # same for all warps of the run
+        try:
+            if forReachability and setup.isVector: 
+                self.graphLayer (setup)
+            elif forMunicipalBudget and setup.isVector: 
+                self.municipalBudgetLayer(setup)
+            elif setup.isVector:     
+                self.standartVectorLayer(setup)
+            else:
+                self.standartRasterLayer(setup)    
+        finally:
+            for path in self.memoryFiles:
+                gdal.Unlink(path)
+
+    def getTempPath(self, fileName, cellCount, dtype):
+        """ path of an intermediate raster, in GDAL memory for the in-memory
+        pipeline while the estimated size of all memory rasters fits the limit"""
+        size = cellCount * numpy.dtype(dtype).itemsize
+        path = '/vsimem/' + fileName
+        # a raster made again with the same name (e.g. for each road class) replaces the old one
+        previousSize = self.memoryFiles.get(path, 0)
+        if inMemoryPipeline and self.memorySize - previousSize + size <= inMemoryLimitMb * 1048576:
+            self.memorySize += size - previousSize
+            self.memoryFiles[path] = size
+            return path
+        return QgsProcessingUtils.tempFolder() + '/' + fileName
     
     def standartVectorLayer (self, setup):
         if setup.isVector :
@@ -1087,63 +1568,106 @@ class CheckLayer:
         print("You are currently importing a raster layer in GeoTIFF format. This will take a while - please be patient!")
         rasterNoData = self.processNoData (setup, setup.fullName)
         if setup.isCanceledAndUpdateProgress(25.0): return None
+        """ each raster is resampled and reprojected once: aggregation keeps the
+        input CRS and is warped to degrees after, rasterToUnits warps straight to
+        EPSG:4326 at the target resolution (from the virtual noData raster)"""
         if (setup.aggregate or setup.summary):
             rasterToWrite = self.aggregateAndSum(setup, rasterNoData)
+            if setup.isCanceledAndUpdateProgress(50.0): return None
+            rasterToWrite = self.metresToDegress (rasterToWrite ,setup,1,"")
         else:
-            rasterToWrite = self.rasterToUnits(setup,rasterNoData)   
-        if setup.isCanceledAndUpdateProgress(50.0): return None
-        rasterToWrite = self.metresToDegress (rasterToWrite ,setup,1,"")
+            rasterToWrite = self.rasterToUnits(setup,rasterNoData)
+            if setup.isCanceledAndUpdateProgress(50.0): return None
         if setup.isCanceledAndUpdateProgress(75.0): return None
         FileWriter(rasterToWrite,setup)
         if setup.isCanceledAndUpdateProgress(100.0): return None
     
     def processNoData(self,setup,path):
-        #Get values list from raster
-        inRaster = gdal.Open(path,GA_ReadOnly)
-        
         # Prepare variables for saving temp files
         today = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_")
-        tempFolder = QgsProcessingUtils.tempFolder()
         filename, file_extension = os.path.splitext(path)
+
+        # NaN values are noData already, other values are remapped
+        noDataValues = sorted(set(float(v) for v in setup.noDataList if not math.isnan(v)))
+        gdalType, dtype = setup.getWorkingPrecision()
+
+        if virtualNoData and len(noDataValues) <= 1 and self.canUseNoDataVrt(path):
+            newRasterPath = self.createNoDataVrt(path, self.getTempPath(today + name + '.vrt', 0, dtype), noDataValues, file_extension != ".tif", gdalType)
+        else:
+            newRasterPath = self.materializeNoData(noDataValues, path, today, file_extension, gdalType, dtype)
+
+        if debuggingMode:
+            layerTesting = QgsRasterLayer(newRasterPath,"Raster From NoData")
+            QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas 
         
+        return newRasterPath
+
+    def canUseNoDataVrt(self, path):
+        """ the VRT gives the values of the copy only when the source noData is not
+        NaN (the VRT drops it, so NaN cells would be valid for warps) and is the
+        same on all bands (a single noData value is set on every band)"""
+        inRaster = gdal.Open(path, GA_ReadOnly)
+        bandNoData = [inRaster.GetRasterBand(i).GetNoDataValue() for i in range(1, inRaster.RasterCount + 1)]
+        inRaster = None
+        if any(value is not None and math.isnan(value) for value in bandNoData):
+            return False
+        return len(set(bandNoData)) <= 1
+
+    def createNoDataVrt(self, path, vrtPath, noDataValues, unscale, gdalType):
+        """ virtual raster in working precision with the noData value set on the band instead
+        of a copy with NaN values. Warps use the band noData and readAsFloat
+        returns it as NaN, so later stages see the same values as with a copy"""
+        vrt = gdal.Translate(vrtPath, gdal.Open(path, GA_ReadOnly), format='VRT', outputType=gdalType, unscale=unscale)
+        for bandIndex in range(1, vrt.RasterCount + 1):
+            band = vrt.GetRasterBand(bandIndex)
+            if noDataValues:
+                band.SetNoDataValue(noDataValues[0])
+            else:
+                band.DeleteNoDataValue() # noData of the source is not remapped in a copy either
+        band = None
+        vrt = None
+        return vrtPath
+
+    def materializeNoData(self, noDataValues, path, today, file_extension, gdalType, dtype):
+        """ copy of the raster in working precision with each noData value as NaN, written in
+        strips of whole source blocks so memory use does not depend on raster size"""
         inRaster = gdal.Open(path)
 
         # Transalte when dataset is not Geotiff because it can be scaled (e.g. NetCDF format)
         if  file_extension != ".tif":
-            translatedPath = tempFolder + '/Translated_' + today + name
+            translatedPath = self.getTempPath('Translated_' + today + name, inRaster.RasterXSize * inRaster.RasterYSize * inRaster.RasterCount, 'f8')
             inRaster = gdal.Translate(translatedPath,inRaster,**{'unscale': True})
         
         countX = inRaster.RasterXSize
         countY = inRaster.RasterYSize
-
         inBand = inRaster.GetRasterBand(useBand)
-        inData = inBand.ReadAsArray(0, 0, countX, countY)
-        inDataFloat = numpy.array(inData , dtype='float') # always translate everything to float
 
-        # trasnalte each value from noData to Not a Number value
-        for inNoData in setup.noDataList:
-            inDataFloat[inDataFloat== inNoData] = float('nan')  
-        
         # Create Output Raster
-        driver = gdal.GetDriverByName('GTiff')
-        newRasterPath = tempFolder + '/' + today + name
+        newRasterPath = self.getTempPath(today + name, countX * countY, dtype)
 
-        raster = driver.Create(newRasterPath, countX, countY, 1, gdal.GDT_Float64)
+        raster = self.createTempRaster(newRasterPath, countX, countY, gdalType)
         raster.SetGeoTransform(inRaster.GetGeoTransform() )
         band = raster.GetRasterBand(1)
         band.SetNoDataValue(float('nan'))
-        band.WriteArray(inDataFloat)
+
+        # strips are made of whole rows of source blocks, at least one block high
+        blockY = max(1, inBand.GetBlockSize()[1])
+        rowsPerStrip = blockY * max(1, int(readBlockSize / max(1, countX * blockY)))
+        for yFrom in range(0, countY, rowsPerStrip):
+            rows = min(rowsPerStrip, countY - yFrom)
+            inData = inBand.ReadAsArray(0, yFrom, countX, rows)
+            outData = numpy.array(inData , dtype=dtype) # always translate everything to float
+            # trasnalte each value from noData to Not a Number value
+            outData[numpy.isin(inData, noDataValues)] = float('nan')
+            band.WriteArray(outData, 0, yFrom)
+
         rasterSRS = osr.SpatialReference()
         rasterSRS.ImportFromWkt(inRaster.GetProjection())
         raster.SetProjection(rasterSRS.ExportToWkt())
         band.FlushCache()
         band = None
         raster = None
-        
-        if debuggingMode:
-            layerTesting = QgsRasterLayer(newRasterPath,"Raster From NoData")
-            QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas 
-        
+
         return newRasterPath
     
     def graphLayer (self, setup):
@@ -1155,15 +1679,18 @@ class CheckLayer:
         lastKey = list(networkMap)[-1]
         progressPercent = 100 / float(len(networkMap.items()))
         counter = 0
-        for key, value in networkMap.items():
-            layerToRaster = self.getSeparatedFeatureLayer(setup, value, key, lastKey)
-            rasterToProcess = self.vectorToRaster(layerToRaster,setup, False, 3, key)
-            rasterToCheck= self.vectorToRaster(layerToRaster,setup, False, 3, key)
-            rasterToGraph = self.rasterToGraph(rasterToProcess ,setup)
+        classFids = self.separateRoadClasses(setup, lastKey)
+        for key in networkMap:
+            layerToRaster = self.getSeparatedFeatureLayer(setup, classFids.pop(key))
+            rasterToCheck = self.vectorToRaster(layerToRaster,setup, False, 3, key)
+            rasterToGraph = self.rasterToGraph(rasterToCheck ,setup)
             graphFile.appendGraphFile (rasterToGraph ,rasterToCheck ,key);
 
             if setup.isCanceledAndUpdateProgress(counter * progressPercent): return None
             counter += 1
+
+        if outputFormat == "bin":
+            graphFile.writeGraphToBin()
             
         print("Done")    
     
@@ -1195,25 +1722,17 @@ class CheckLayer:
             return layerIn
         
     def vectorToRaster(self,layerInput,setup,makeBigger, resBoost, cat):
-        # project layer for geting size of the cell in degress
-        parameterReproject = { 'INPUT':layerInput,\
-                            'TARGET_CRS': 'EPSG:4326' ,\
-                            'OUTPUT': 'memory:'}
-        result = processing.run('qgis:reprojectlayer', parameterReproject)
-        reprojectedVector = result['OUTPUT']
-        
-        if debuggingMode:
-            QgsProject.instance().addMapLayer(reprojectedVector) # adding to canvas
-        
-        # reproject separately extend (case of all points)
-        parameterReprojectExtent = { 'INPUT': setup.layer,\
-                                    'TARGET_CRS': 'EPSG:4326',\
-                                    'OUTPUT': 'memory:'}
-        result = processing.run('qgis:reprojectlayer', parameterReprojectExtent)
-        reprojectedExtent = result['OUTPUT']
-        
-        if  debuggingMode:
-            QgsProject.instance().addMapLayer(reprojectedExtent) # adding to canvas
+        # reproject separately extend (case of all points), once for each layer
+        if setup.layer.id() not in self.reprojectedExtents:
+            parameterReprojectExtent = { 'INPUT': setup.layer,\
+                                        'TARGET_CRS': 'EPSG:4326',\
+                                        'OUTPUT': 'memory:'}
+            result = processing.run('qgis:reprojectlayer', parameterReprojectExtent)
+            self.reprojectedExtents[setup.layer.id()] = result['OUTPUT']
+
+            if  debuggingMode:
+                QgsProject.instance().addMapLayer(result['OUTPUT']) # adding to canvas
+        reprojectedExtent = self.reprojectedExtents[setup.layer.id()]
 
         if (makeBigger): # in case of point and roads the raster extent must be bigger
             e = reprojectedExtent.extent()
@@ -1239,40 +1758,86 @@ class CheckLayer:
             iface.mapCanvas().zoomScale(scale)
             iface.mapCanvas().refresh()
 
-        reprojectedRaster = QgsProcessingUtils.tempFolder()+ "/" + cat + "Rasterized_Layer.tif"
+        e = reprojectedExtent if isinstance(reprojectedExtent, QgsRectangle) else reprojectedExtent.extent()
+        cellRes = setup.res / resBoost
+        gdalType, dtype = setup.getWorkingPrecision()
+        reprojectedRaster = self.getTempPath(cat + "Rasterized_Layer.tif", int(math.ceil(e.width() / cellRes) * math.ceil(e.height() / cellRes)), dtype)
         
         if os.path.isfile(reprojectedRaster):
             os.remove(reprojectedRaster)
 
+        # project layer for geting size of the cell in degress
+        parameterReproject = { 'INPUT':layerInput,\
+                            'TARGET_CRS': 'EPSG:4326' ,\
+                            'OUTPUT': 'memory:'}
+        result = processing.run('qgis:reprojectlayer', parameterReproject)
+        reprojectedVector = result['OUTPUT']
+        
+        if debuggingMode:
+            QgsProject.instance().addMapLayer(reprojectedVector) # adding to canvas
+
         # create grided data. resBoost used by graph to  create higger resolution
         #For help--> processing.algorithmHelp("gdal:rasterize")"""
-        
-        parameterRasterize = {'INPUT': reprojectedVector,\
-                      'FIELD': setup.getFieldCat(),\
-                      'UNITS': 1,\
-                      'WIDTH': setup.res / resBoost,\
-                      'HEIGHT':setup.res / resBoost,\
-                      'EXTENT':reprojectedExtent,\
-                      'DATA_TYPE': 6,\
-                      'INVERT': False,\
-                      'INIT': float('nan'),\
-                      'OUTPUT':reprojectedRaster }
-        try:
-            processing.run("gdal:rasterize",parameterRasterize)  
-        except:
-            processing.run("gdal:rasterize",parameterRasterize)
-            print("A bug has been detected in QGIS. No action required for now.")
+        if reprojectedRaster.startswith('/vsimem/'): # not visible to the processing tools
+            self.rasterizeInProcess(reprojectedVector, setup.getFieldCat(), e, cellRes, gdalType, reprojectedRaster)
+        else:
+            parameterRasterize = {'INPUT': reprojectedVector,\
+                          'FIELD': setup.getFieldCat(),\
+                          'UNITS': 1,\
+                          'WIDTH': cellRes,\
+                          'HEIGHT':cellRes,\
+                          'EXTENT':reprojectedExtent,\
+                          'DATA_TYPE': 5 if dtype == 'f4' else 6, # gdal:rasterize enum: 5 = Float32, 6 = Float64
+                          'INVERT': False,\
+                          'INIT': float('nan'),\
+                          'OUTPUT':reprojectedRaster }
+            try:
+                processing.run("gdal:rasterize",parameterRasterize)  
+            except:
+                processing.run("gdal:rasterize",parameterRasterize)
+                print("A bug has been detected in QGIS. No action required for now.")
         
         if debuggingMode:
             layerTesting = QgsRasterLayer(reprojectedRaster,"Rasterized layer")
             QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas
 
         return reprojectedRaster    
+
+    def rasterizeInProcess(self, layer, fieldName, extent, cellRes, gdalType, path):
+        """ gdal:rasterize with gdal.Rasterize in this process, for rasters in GDAL
+        memory. The features are copied to an OGR memory layer with only the
+        field, NULL values are left unset and burnt as 0 as by gdal_rasterize"""
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+        vectorDs = ogr.GetDriverByName('Memory').CreateDataSource('')
+        vectorLayer = vectorDs.CreateLayer('features', srs)
+        vectorLayer.CreateField(ogr.FieldDefn('value', ogr.OFTReal))
+        request = QgsFeatureRequest().setSubsetOfAttributes([fieldName], layer.fields())
+        for feature in layer.getFeatures(request):
+            if not feature.hasGeometry():
+                continue
+            outFeature = ogr.Feature(vectorLayer.GetLayerDefn())
+            outFeature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(feature.geometry().asWkb())))
+            try:
+                outFeature.SetField('value', float(feature[fieldName]))
+            except (TypeError, ValueError): # NULL values
+                pass
+            vectorLayer.CreateFeature(outFeature)
+
+        gdal.Rasterize(path, vectorDs, format='GTiff', outputType=gdalType, creationOptions=self.getCreationOptions(gdalType),
+                       outputBounds=[extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+                       xRes=cellRes, yRes=cellRes, initValues=[float('nan')], attribute='value')
         
     def rasterToUnits(self,setup, raster):
         # change reolution first. For help--> processing.algorithmHelp("gdal:translate")
    
-        reprojectedRaster = QgsProcessingUtils.tempFolder()+"/Reprojected_Layer.tif"
+        # estimate size of the output from the extent of the input in degrees
+        inRaster = gdal.Open(raster, GA_ReadOnly)
+        inWidth, inHeight = abs(inRaster.GetGeoTransform()[1]) * inRaster.RasterXSize, abs(inRaster.GetGeoTransform()[5]) * inRaster.RasterYSize
+        if setup.isInMetres:
+            inWidth, inHeight = geoCalculator().metressToDegressBetwenLons(inWidth), geoCalculator().metressToDegressBetwenLons(inHeight)
+        inRaster = None
+        reprojectedRaster = self.getTempPath("Reprojected_Layer.tif", int(math.ceil(inWidth / setup.res) * math.ceil(inHeight / setup.res)), setup.getWorkingPrecision()[1])
         if os.path.isfile(reprojectedRaster):
             os.remove(reprojectedRaster)
        
@@ -1283,10 +1848,10 @@ class CheckLayer:
                         'TARGET_RESOLUTION': setup.res,\
                         'NODATA':float('nan'),\
                         'RESAMPLING':resamplingMethod,\
-                        'DATA_TYPE':6,\
-                        'MULTITHREADING':False,\
+                        'DATA_TYPE':6 if setup.getWorkingPrecision()[1] == 'f4' else 7, # gdal:warpreproject enum (0 = input type): 6 = Float32, 7 = Float64
                         'OUTPUT':reprojectedRaster}
-        processing.run("gdal:warpreproject", parameterWarp)
+        parameterWarp.update(self.warpParameters)
+        self.runWarp(parameterWarp)
         
         if not QgsRasterLayer(reprojectedRaster,"Reprojected Raster").isValid():
             print("Oops! There is not enough storage on your disk for this size and resolution.")
@@ -1302,7 +1867,10 @@ class CheckLayer:
         if not setup.isInMetres:
             return layerForWarp # no need to translate to degress when already
           
-        rasterDegress = QgsProcessingUtils.tempFolder()+"/"+ cat + "Raster_Degress.tif"
+        inRaster = gdal.Open(layerForWarp, GA_ReadOnly)
+        inDtype = numpy.dtype('f4') if gdal.GetDataTypeSize(inRaster.GetRasterBand(useBand).DataType) <= 32 else numpy.dtype('f8')
+        rasterDegress = self.getTempPath(cat + "Raster_Degress.tif", inRaster.RasterXSize * inRaster.RasterYSize, inDtype)
+        inRaster = None
         if os.path.isfile(rasterDegress):
             os.remove(rasterDegress)
         
@@ -1314,10 +1882,10 @@ class CheckLayer:
                     'TARGET_CRS': 'EPSG:4326',\
                     'TARGET_RESOLUTION': 0,\
                     'RESAMPLING':resamplingMethod,\
-                    'MULTITHREADING':False,\
                     'OUTPUT': rasterDegress}
+        parameterWarp.update(self.warpParameters)
          
-        processing.run("gdal:warpreproject", parameterWarp)
+        self.runWarp(parameterWarp)
         
         if debuggingMode:
             layerTesting = QgsRasterLayer(rasterDegress,"Raster in Degress")
@@ -1325,6 +1893,72 @@ class CheckLayer:
     
         return rasterDegress
     
+    def runWarp(self, parameterWarp):
+        """ run gdal:warpreproject, rasters in GDAL memory are not visible to
+        the processing tools so these are warped with gdal.Warp in this process"""
+        if not (parameterWarp['INPUT'].startswith('/vsimem/') or parameterWarp['OUTPUT'].startswith('/vsimem/')):
+            processing.run("gdal:warpreproject", parameterWarp)
+            return
+
+        # -wm, -wo and --config of the performance profile, config options only for this warp
+        extra = parameterWarp.get('EXTRA', '').split()
+        warpOptions = [extra[i + 1] for i in range(len(extra) - 1) if extra[i] == '-wo']
+        warpMemory = [int(extra[i + 1]) for i in range(len(extra) - 1) if extra[i] == '-wm']
+        configOptions = {extra[i + 1]: extra[i + 2] for i in range(len(extra) - 2) if extra[i] == '--config'}
+        resolution = parameterWarp.get('TARGET_RESOLUTION', 0)
+        with gdalConfig(configOptions):
+            gdal.Warp(parameterWarp['OUTPUT'], parameterWarp['INPUT'],
+                      format='GTiff',
+                      srcSRS=parameterWarp.get('SOURCE_CRS') or None,
+                      dstSRS=parameterWarp['TARGET_CRS'],
+                      xRes=resolution or None,
+                      yRes=resolution or None,
+                      dstNodata=parameterWarp.get('NODATA'),
+                      resampleAlg=warpResampling[parameterWarp['RESAMPLING']],
+                      outputType=parameterWarp.get('DATA_TYPE', gdal.GDT_Unknown),
+                      multithread=parameterWarp['MULTITHREADING'],
+                      warpMemoryLimit=warpMemory[0] if warpMemory else None,
+                      warpOptions=warpOptions,
+                      creationOptions=parameterWarp['OPTIONS'].split('|') if parameterWarp.get('OPTIONS') else None)
+
+    def getWarpParameters(self):
+        """ multithreading, memory and creation options for gdal:warpreproject,
+        GDAL defaults unless the performance profile is on. Called once per run"""
+        if not performanceProfile:
+            return {'MULTITHREADING': False}
+
+        # half of the memory share is used for warping and half for the block cache,
+        # passed in bytes as gdalwarp reads -wm of 10000 or more (and GDAL_CACHEMAX
+        # of 100000 or more) as bytes instead of MB
+        availableMb = getAvailableMemoryMb()
+        memoryMb = 256 if availableMb is None else max(64, int(availableMb * performanceMemoryShare / 2))
+        memoryBytes = str(memoryMb * 1048576)
+        # warped rasters are always float, compressed even when temp rasters are not
+        compression = tempCompression if tempCompression.upper() != 'NONE' else 'ZSTD'
+        options = '|'.join(self.getCreationOptions(gdal.GDT_Float32, compression))
+        print("Performance profile: multithreaded warp with GDAL_NUM_THREADS=ALL_CPUS, warp memory " + str(memoryMb) + " MB, GDAL cache "
+              + str(memoryMb) + " MB (available RAM " + ("unknown" if availableMb is None else str(int(availableMb)) + " MB") + "), creation options " + options)
+        return {'MULTITHREADING': True,\
+                'OPTIONS': options,\
+                'EXTRA': '-wm ' + memoryBytes + ' -wo NUM_THREADS=ALL_CPUS --config GDAL_CACHEMAX ' + memoryBytes + ' --config GDAL_NUM_THREADS ALL_CPUS'}
+
+    def getCreationOptions(self, gdalType, compression=None):
+        """ creation options of temp GeoTIFFs: tiled, compressed (tempCompression
+        unless given) with a predictor for the data type and BigTIFF when the size may need it"""
+        options = ['TILED=YES', 'BLOCKXSIZE=' + str(tempBlockSize), 'BLOCKYSIZE=' + str(tempBlockSize), 'BIGTIFF=IF_SAFER']
+        compression = (compression or tempCompression).upper()
+        if compression == 'ZSTD' and 'ZSTD' not in (gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST') or ''):
+            compression = 'DEFLATE'
+        if compression != 'NONE':
+            isFloat = gdalType in (gdal.GDT_Float32, gdal.GDT_Float64)
+            options += ['COMPRESS=' + compression, 'PREDICTOR=' + ('3' if isFloat else '2')]
+        return options
+
+    def createTempRaster(self, path, countX, countY, gdalType):
+        """ single band temp GeoTIFF, all stages create their rasters here"""
+        driver = gdal.GetDriverByName('GTiff')
+        return driver.Create(path, countX, countY, 1, gdalType, options=self.getCreationOptions(gdalType))
+
     def countPointsInCell(self,raster,setup):
     
         """ reprojects points to same CRS as raster"""
@@ -1339,48 +1973,38 @@ class CheckLayer:
         ds = gdal.Open(raster )
         cols,rows = ds.RasterXSize, ds.RasterYSize
         gt = ds.GetGeoTransform()
-        # read array from cells
-        data = ds.GetRasterBand(useBand).ReadAsArray(0, 0, cols,rows)
-        valueData = data.copy()
-        """make sure all values are 0 on start (case when category is mix of values and text)"""
-        for y in range(0, rows):
-            for x in range(0, cols):
-                data[y, x] =0
-
-        for y in range(0, rows):
-            for x in range(0, cols):
-                valueData[y, x] =float("nan")
-
-        """ for each point in cell add 1 if not noDataValue"""
-       
-        for feature in pl.getFeatures():
-            xP,yP = feature.geometry().asPoint()
-            xR = int(math.floor((xP- gt[0])/gt[1]))
-            yR = int(math.floor((yP - gt[3])/gt[5]))
-            if (xR>=0 and yR>=0) and not (str(feature[field]) == noDataValue):
-                data[yR,xR] = data[yR,xR]+1
-        if not setup.isCategorized:
-            for feature in pl.getFeatures():
-                xP,yP = feature.geometry().asPoint()
-
-                xR = int(math.floor((xP- gt[0])/gt[1]))
-                yR = int(math.floor((yP - gt[3])/gt[5]))
-
-                if(yR >= 0 and xR >=0): # in case some point are off extent
-                    if not math.isnan(valueData[yR,xR]):
-                        valueData[yR,xR] = (valueData[yR,xR]  + feature[field])*0.5
-                    else:
-                        valueData[yR,xR] = feature[field]
-    
-            data = valueData   
-        newRaster= QgsProcessingUtils.tempFolder()+"/rasterForCountingPoints.tif"
+        # cells are counted in the data type of the raster, without reading it
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(ds.GetRasterBand(useBand).DataType)
+
+        """ cells, values and noData flags of all points in one pass, read in
+        batches with only the field and the points"""
+        reader = FeatureReader(pl, field, True)
+        cellIndex, values, isCounted = [numpy.zeros(0, dtype=numpy.int64)], [numpy.zeros(0)], [numpy.zeros(0, dtype=bool)]
+        for ids, batchValues, xs, ys in reader.batches():
+            xR = numpy.floor((xs - gt[0]) / gt[1]).astype(numpy.int64)
+            yR = numpy.floor((ys - gt[3]) / gt[5]).astype(numpy.int64)
+            inside = (xR >= 0) & (yR >= 0) & (xR < cols) & (yR < rows) # in case some point are off extent
+            cellIndex.append(numpy.where(inside, yR * cols + xR, 0))
+            isCounted.append(inside & numpy.array([not (str(value) == noDataValue) for value in batchValues], dtype=bool))
+            if not setup.isCategorized:
+                values.append(reader.valuesAsFloat(batchValues))
+        cellIndex, values, isCounted = numpy.concatenate(cellIndex), numpy.concatenate(values), numpy.concatenate(isCounted)
+
+        """ for each point in cell add 1 if not noDataValue (all values are 0 on start,
+        case when category is mix of values and text)"""
+        counts = numpy.bincount(cellIndex[isCounted], minlength=rows * cols)
+        data = counts.reshape(rows, cols).astype(dtype)
+
+        if not setup.isCategorized and pointStatistic != "count":
+            data = self.getPointStatistic(cellIndex, values, isCounted, rows * cols).reshape(rows, cols).astype(dtype)
+
+        newRaster= self.getTempPath("rasterForCountingPoints.tif", cols * rows, setup.getWorkingPrecision()[1])
         originX = gt[0]
         originY = gt[3]
         pixelWidth = gt[1]
         pixelHeight = gt[5]
 
-        driver = gdal.GetDriverByName('GTiff')
-        outRaster = driver.Create(newRaster, cols, rows, 1, gdal.GDT_Float64)
+        outRaster = self.createTempRaster(newRaster, cols, rows, setup.getWorkingPrecision()[0])
         outRaster.SetGeoTransform((originX, pixelWidth, 0, originY, 0, pixelHeight))
         outband = outRaster.GetRasterBand(useBand)
         outband.WriteArray(data)
@@ -1397,6 +2021,28 @@ class CheckLayer:
     
         return newRaster
         
+    def getPointStatistic(self, cellIndex, values, isValid, cellCount):
+        """ pointStatistic of the point values in each cell (NaN for cells without
+        values), all statistics are accumulated per cell in one pass over the points"""
+        isValid = isValid & ~numpy.isnan(values)
+        cells, values = cellIndex[isValid], values[isValid]
+
+        counts = numpy.bincount(cells, minlength=cellCount)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            if pointStatistic == "sum":
+                result = numpy.bincount(cells, weights=values, minlength=cellCount)
+            elif pointStatistic == "mean":
+                # shift by the mean of all values so large offsets don't lose precision in the sums
+                shift = values.mean() if values.size else 0.0
+                result = numpy.bincount(cells, weights=values - shift, minlength=cellCount) / counts + shift
+            elif pointStatistic in ("min", "max"):
+                result = numpy.full(cellCount, numpy.inf if pointStatistic == "min" else -numpy.inf)
+                (numpy.minimum if pointStatistic == "min" else numpy.maximum).at(result, cells, values)
+            else:
+                raise Exception("Unknown pointStatistic: " + str(pointStatistic))
+
+        return numpy.where(counts > 0, result, float("nan"))
+
     def rasterToGraph(self,raster, setup):
        
         """ Get rasters and tranformation information"""
@@ -1410,30 +2056,18 @@ class CheckLayer:
         data = dataset.GetRasterBand(useBand).ReadAsArray(0, 0, countX, countY)
     
         newY , newX = int(countY/3), int(countX/3)
-        newArray = [[0] * newX for i in range(newY)]
-
-        """ check each cell and write nod if meet condition, skip edges rows and columns"""
-        for y in range(0, int(countY/3)):
-            for x in range(0, int(countX/3)):
-                # check data in cell 3X3, skipping corners (more info in TS#56)
-                tm = data[(y*3) + 0,(x*3)+1]>0
-                ml = data[(y*3) + 1,(x*3)+0]>0
-                mm = data[(y*3) + 1,(x*3)+1]>0
-                mr = data[(y*3) + 1,(x*3)+2]>0
-                dm = data[(y*3) + 2,(x*3)+1]>0 
-                if tm or ml or mm or mr or dm:
-                    value = 1
-                else: 
-                    value = 0 
-                newArray[y][x] = value
+
+        """ split into 3X3 cells (rows and columns left over are skipped) and write
+        nod if meet condition: data in cell 3X3, skipping corners (more info in TS#56)"""
+        with numpy.errstate(invalid='ignore'):
+            cells = data[:newY * 3, :newX * 3].reshape(newY, 3, newX, 3) > 0
+        newArray = cells[:, 0, :, 1] | cells[:, 1, :, 0] | cells[:, 1, :, 1] | cells[:, 1, :, 2] | cells[:, 2, :, 1]
 
         gtNew = [minX, w*3, 0, minY, 0, h*3]
-        driver = gdal.GetDriverByName('GTiff')
-        newOutputRaster = QgsProcessingUtils.tempFolder()+"Agregated_Raster.tif"
-        dst_ds = driver.Create(newOutputRaster, int(countX/3), int(countY/3),  1, gdal.GDT_Int16)
+        newOutputRaster = self.getTempPath("Agregated_Raster.tif", newX * newY, 'u1')
+        dst_ds = self.createTempRaster(newOutputRaster, newX, newY, gdal.GDT_Byte)
         band = dst_ds.GetRasterBand(useBand)
-        band.WriteArray(numpy.array( newArray) )
-        band.SetNoDataValue(float("nan"))
+        band.WriteArray(newArray.astype(numpy.uint8))
 
         dst_ds.SetGeoTransform(gtNew)
         srs = osr.SpatialReference()
@@ -1447,7 +2081,30 @@ class CheckLayer:
             QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas
         
         return newOutputRaster 
-    def getSeparatedFeatureLayer(self,setup, roadTypesList, key, lastKey):
+    def separateRoadClasses(self, setup, lastKey):
+        """ ids of the features of each networkMap class, from one pass over the
+        field values. Values listed in the last class are ignored and all
+        features not listed anywhere belong to the last class"""
+        classesOfValue = {}
+        for key, roadTypesList in networkMap.items():
+            for roadType in roadTypesList:
+                classes = classesOfValue.setdefault(roadType, [])
+                if key != lastKey and key not in classes:
+                    classes.append(key)
+
+        classFids = {key: [] for key in networkMap}
+        other = [lastKey]
+        for ids, values, xs, ys in FeatureReader(setup.layer, field).batches():
+            for fid, value in zip(ids.tolist(), values):
+                try:
+                    classes = classesOfValue.get(value, other)
+                except TypeError: # unhashable values are in no list
+                    classes = other
+                for key in classes:
+                    classFids[key].append(fid)
+        return classFids
+
+    def getSeparatedFeatureLayer(self,setup, fids):
         """ create temporary layer for each group of features"""    
         setCRS = setup.layer.crs().authid()
         layerTemp = QgsVectorLayer("LineString?crs="+setCRS,"LayerTemp", "memory")
@@ -1458,19 +2115,10 @@ class CheckLayer:
         dp.addAttributes(attr)
         layerTemp.updateFields()
 
-        """ add feature if in list and simuntaneosly add to ignore list for the
-        last round when all what is not in ignore list will be added to other """
-        features = []
-        last = key == lastKey
-        for feature in setup.layer.getFeatures():
-            if not last and feature[field] in roadTypesList :
-                features.append(feature)
-            elif last and feature[field] not in roadTypesList:
-                features.append(feature)
-        dp.addFeatures(features)
-        
-        if not last: # ignore roadtypes added for previous category
-            networkMap[lastKey].extend(roadTypesList)
+        """ add features of the group (see separateRoadClasses), whole features
+        are read only for them"""
+        if fids:
+            dp.addFeatures(list(setup.layer.getFeatures(QgsFeatureRequest().setFilterFids(fids))))
     
         """add cotegory column """ 
         parameters = {'INPUT':layerTemp,\
@@ -1483,11 +2131,9 @@ class CheckLayer:
         SeparateCat = processing.run('qgis:addfieldtoattributestable', parameters)
 
         """chnage name for index""" 
-        SeparateCat["OUTPUT"].startEditing()
-        for feature in SeparateCat["OUTPUT"].getFeatures():
-            colId = feature.fieldNameIndex("catID") 
-            SeparateCat["OUTPUT"].changeAttributeValue(feature.id(),colId, 1)
-        SeparateCat["OUTPUT"].commitChanges()
+        colId = SeparateCat["OUTPUT"].fields().indexOf("catID")
+        for ids, values, xs, ys in FeatureReader(SeparateCat["OUTPUT"], "catID").batches():
+            SeparateCat["OUTPUT"].dataProvider().changeAttributeValues({int(fid): {colId: 1} for fid in ids})
         
         if debuggingMode:
             QgsProject.instance().addMapLayer(layerTemp )
@@ -1525,10 +2171,6 @@ class CheckLayer:
         if newResolutionX < inDegPerCellX or abs(newResolutionY) < abs(inDegPerCellY):
             raise Exception("newResolution can't be smaller than the layer resolution: " + str(max(inDegPerCellX,inDegPerCellY)))
 
-        inBand = inRaster.GetRasterBand(useBand)
-        inData = inBand.ReadAsArray(0, 0, inCountX, inCountY)
-        inData = numpy.array(inData , dtype='float') # always translate everything to float
-        
         ### Use geolocator if inpt raster if in deggres and output resolution metres ###
 
         scaleX = newResolutionX / inDegPerCellX
@@ -1541,12 +2183,6 @@ class CheckLayer:
         outCountY = int(math.floor(inCountY / scaleX))
         outDegPerCellX = inDegPerCellX * scaleX
         outDegPerCellY = inDegPerCellY * scaleY
-        areaMultX = (1 / inDegPerCellX)
-        areaMultY = (1 / inDegPerCellY)
-        
-        outData =  numpy.ndarray(shape=(outCountY,outCountX), dtype=numpy.dtype('f8'), order='F')
-        ## no need for output data # if outputNoData is None: outputNoData = setup.noData
-        outData[:] = float("nan")  # Initialize array with NoData
 
         inWidth = inCountX * inDegPerCellX
         inHeight = inCountY * inDegPerCellY
@@ -1556,112 +2192,67 @@ class CheckLayer:
         if sizePercent >= 1: # this means that the new raster will be 1% (or more) smaller
             print("\nWARNING: The output raster will be smaller (" + str(outWidth) + " by " + str(abs(outHeight)) + "). That's " + "{:.1f}".format(sizePercent).replace(".0", "") + "% smaller\n")
 
-        # Go thru all cells in the output grid to calculate the aggregated value
-        for outY in range(0, outCountY):
-
-            # Calculate vertical extent (north, south) of output cell 
-            outN = outMaxY + outY * outDegPerCellY
-            outS = outN + outDegPerCellY
-           
-            # Calculate vertical range of affected input cells
-            inFromY = int(math.floor(outY * scaleY))
-            inToY = int(math.ceil((outY + 1) * scaleY))
-            
-            for outX in range(0, outCountX):
-                # Calculate horizontal extent (west, east) of output cell
-                outW = outMinX + outX * outDegPerCellX
-                outE = outW + outDegPerCellX
-            
-                # Calculate horizontal range of affected input cells
-                inFromX = int(math.floor(outX * scaleX))
-                inToX = int(math.ceil((outX + 1) * scaleX))
-        
-                #print(">>>>>> Output[" + str(outX) + "," + str(outY) + "]")
-                aggregatedValue = 0
-                aggregatedSqKm = 0
-                aggregatedRatio = 0
-                # Go thru each Input grid cell that intersect with the Output grid cell
-                for inY in range (abs(inFromY), abs(inToY)):
-                    # Calculate vertical extent (north, south) of input cell
-                    inN = inMaxY + inY * inDegPerCellY
-                    inS = inN + inDegPerCellY
-            
-                    # Calculate vertical intersection between Input and Output cells
-                    south = max(outS, inS)
-                    north = min(outN, inN)
-
-                    # Calculate height of the intersection area
-                    if setup.inputCRS == 'EPSG:4326':
-                        heightKm = geoCalculator().distanceBetweenLats(south, north);
-                    else:
-                        heightKm = (south - north) * 0.001; # translate from metres to Km
-            
-                    for inX in range(inFromX, inToX):
-                        inValue = inData[inY,inX]
-                        #print("   <<< Input[" + str(inX) + "," + str(inY) + "] = " + str(inValue))
-                
-                        if math.isnan(inValue):
-                            if not convertNoData:
-                                #print("   <<< Input[" + str(inX) + "," + str(inY) + "] = NO-DATA")
-                                aggregatedSqKm = 0
-                                inY = inToY  # Hack: break out of the second loop
-                                break
-                            else:
-                                continue
-                
-                        # Calculate horizontal extent (west, east) of input cell
-                        inW = inMinX + inX * inDegPerCellX
-                        inE = inW + inDegPerCellX
-                
-                        # Calculate horizontal intersection between Input and Output cells
-                        west = max(outW, inW)
-                        east = min(outE, inE)
-                
-                        # Calculate intersection area
-                        if setup.inputCRS == 'EPSG:4326':
-                            widthKm = geoCalculator().distanceBetweenLons(west, east);
-                        else:
-                            widthKm = (west - east) * 0.001 # translate from metres to Km
-                        
-                        areaRatio = (float)((east-west) *areaMultX   * (south - north)* areaMultY);
-                        
-                        intersectionAreaSqKm = widthKm * heightKm
-                        aggregatedSqKm += intersectionAreaSqKm
-                        aggregatedRatio +=  areaRatio
-
-                        if setup.isRelative :
-                            aggregatedValue += inValue * intersectionAreaSqKm 
-        
-                        else:
-                            aggregatedValue += inValue * areaRatio
-       
-                # Finally assign the aggregated average values or summarized values
-                if aggregatedSqKm == 0:
-                    outData[outY,outX] = float("nan")
-                else:
-                    if setup.isRelative and not setup.summary:
-                        outData[outY,outX] = aggregatedValue  
-                    elif setup.isRelative and setup.summary:
-                        outData[outY,outX] = aggregatedValue * setup.unitsMultiply
-                    elif not setup.isRelative and setup.summary  :
-                        outData[outY,outX] = aggregatedValue 
-                    elif not setup.isRelative and not setup.summary :
-                        outData[outY,outX] = aggregatedValue / aggregatedRatio
-
         # Create Output Raster
         if projRef is None:
             projRef = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433],AUTHORITY["EPSG","4326"]]'
-        driver = gdal.GetDriverByName('GTiff')
         today = datetime.datetime.now()
-        newRasterPath = QgsProcessingUtils.tempFolder() + '/' + today.strftime("%Y%m%d_%H%M%S_") + name
-        raster = driver.Create(newRasterPath, outCountX, outCountY, 1, gdal.GDT_Float64)
+        gdalType, dtype = setup.getWorkingPrecision()
+        newRasterPath = self.getTempPath(today.strftime("%Y%m%d_%H%M%S_") + name, outCountX * outCountY, dtype)
+        raster = self.createTempRaster(newRasterPath, outCountX, outCountY, gdalType)
         raster.SetGeoTransform((outMinX, outDegPerCellX, 0, outMaxY, 0, outDegPerCellY))
         band = raster.GetRasterBand(1)
         band.SetNoDataValue(float("nan"))
-        band.WriteArray(outData)
         rasterSRS = osr.SpatialReference()
         rasterSRS.ImportFromWkt(projRef)
         raster.SetProjection(rasterSRS.ExportToWkt())
+
+        # Precompute the intersection of input and output cells once for all rows and columns
+        inDegrees = setup.inputCRS == 'EPSG:4326'
+        rows = self.getAggregationWeights(outMaxY, outDegPerCellY, outCountY, inMaxY, inDegPerCellY, inCountY, scaleY, inDegrees, True)
+        cols = self.getAggregationWeights(outMinX, outDegPerCellX, outCountX, inMinX, inDegPerCellX, inCountX, scaleX, inDegrees, False)
+
+        # Stream strips of input rows aligned to blocks of output rows, so only
+        # one strip per worker is held in memory, and write each block to the output raster
+        rowsPerBlock = max(1, int(aggregationBlockSize / max(1, rows[0].shape[1] * inCountX)))
+        blocks = [(outFromY, tuple(weights[outFromY:outFromY + rowsPerBlock] for weights in rows))
+                  for outFromY in range(0, outCountY, rowsPerBlock)]
+        mode = (setup.isRelative, setup.summary, setup.unitsMultiply, convertNoData)
+
+        written = 0
+        canceled = False
+        workerPython = None
+        if aggregationWorkers > 1 and len(blocks) > 1 and not rasterPath.startswith('/vsimem/'): # worker processes can't see GDAL memory
+            workerPython = getWorkerPython()
+            if workerPython is None:
+                print("No python interpreter found for worker processes. Continuing in a single process.")
+        if workerPython is not None:
+            # spawn the bundled python, inside QGIS sys.executable is usually the QGIS binary
+            context = multiprocessing.get_context('spawn')
+            previousExecutable = multiprocessing.spawn.get_executable()
+            context.set_executable(workerPython)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=aggregationWorkers, mp_context=context) as executor:
+                    futures = [executor.submit(aggregateStrip, rasterPath, useBand, blockRows, cols, mode, dtype) for outFromY, blockRows in blocks]
+                    for future in futures:
+                        band.WriteArray(future.result(), 0, blocks[written][0])
+                        written += 1
+                        canceled = setup.isCanceledAndUpdateProgress(25.0 + 25.0 * written / len(blocks))
+                        if canceled:
+                            for future in futures:
+                                future.cancel()
+                            break
+            except (concurrent.futures.BrokenExecutor, pickle.PicklingError, ImportError, OSError) as error:
+                print("Aggregation in parallel processes is not available (" + str(error) + "). Continuing in a single process.")
+            finally:
+                context.set_executable(previousExecutable)
+
+        # Aggregate in this process (or what is left if worker processes failed to start)
+        while written < len(blocks) and not canceled:
+            outFromY, blockRows = blocks[written]
+            band.WriteArray(aggregateStrip(rasterPath, useBand, blockRows, cols, mode, dtype), 0, outFromY)
+            written += 1
+            canceled = setup.isCanceledAndUpdateProgress(25.0 + 25.0 * written / len(blocks))
+
         band.FlushCache()
 
         band = None
@@ -1671,7 +2262,85 @@ class CheckLayer:
             QgsProject.instance().addMapLayer( layerTesting ) # adding to canvas 
         
         return newRasterPath
-        
+
+    def getAggregationWeights(self, outStart, outStep, outCount, inStart, inStep, inCount, scale, inDegrees, isLatitude):
+        """ For each output row (or column) get the indices of intersecting input
+        rows (or columns) padded to the same size, mask of real intersections,
+        intersection size in Km and intersection ratio of the input cell"""
+        outCells = numpy.arange(outCount)
+        inFrom = numpy.floor(outCells * scale).astype(int)
+        inTo = numpy.minimum(numpy.ceil((outCells + 1) * scale).astype(int), inCount)
+        size = max(1, int((inTo - inFrom).max())) if outCount > 0 else 1
+
+        index = inFrom[:, None] + numpy.arange(size)[None, :]
+        inWindow = index < inTo[:, None]
+        index = numpy.minimum(index, inCount - 1)
+
+        # Calculate intersection between Input and Output cells
+        outFirst = (outStart + outCells * outStep)[:, None]
+        outSecond = outFirst + outStep
+        inFirst = inStart + index * inStep
+        inSecond = inFirst + inStep
+        low = numpy.maximum(numpy.minimum(outFirst, outSecond), numpy.minimum(inFirst, inSecond))
+        high = numpy.minimum(numpy.maximum(outFirst, outSecond), numpy.maximum(inFirst, inSecond))
+
+        # Calculate size of the intersection
+        if inDegrees and isLatitude:
+            sizeKm = geoCalculator().distanceBetweenLats(low, high)
+        elif inDegrees:
+            sizeKm = geoCalculator().distanceBetweenLons(low, high)
+        else:
+            sizeKm = (high - low) * 0.001 # translate from metres to Km
+        ratio = (high - low) / abs(inStep)
+
+        return index, inWindow, numpy.where(inWindow, sizeKm, 0), numpy.where(inWindow, ratio, 0)
+
+def getAvailableMemoryMb():
+    """ Available physical memory in MB from psutil (if installed) or sysconf,
+    None when it can't be found out"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1048576.0
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (AttributeError, ValueError, OSError):
+        return None
+
+@contextlib.contextmanager
+def gdalConfig(options):
+    """ Set GDAL config options (GDAL_CACHEMAX in bytes also sets the block cache)
+    for one in process call and restore the previous values after, so the
+    rest of the QGIS session keeps its own settings"""
+    previous = {key: gdal.GetConfigOption(key) for key in options}
+    previousCacheMax = gdal.GetCacheMax()
+    try:
+        for key, value in options.items():
+            gdal.SetConfigOption(key, value)
+        if 'GDAL_CACHEMAX' in options:
+            gdal.SetCacheMax(int(options['GDAL_CACHEMAX']))
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+        gdal.SetCacheMax(previousCacheMax)
+
+def getWorkerPython():
+    """ Python interpreter for worker processes: sys.executable when it is python,
+    else the interpreter bundled with QGIS (next to its python library), None
+    when there is none"""
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    version = 'python' + str(sys.version_info[0]) + '.' + str(sys.version_info[1])
+    folders = [sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin'), os.path.dirname(sys.executable), os.path.join(os.path.dirname(sys.executable), 'bin')]
+    for folder in folders:
+        for fileName in ['pythonw.exe', 'python.exe', version, 'python3', 'python']:
+            path = os.path.join(folder, fileName)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+    return None
+
 class geoCalculator:
     EarthRadiusKm = 6378.137 # Radius of earth in kilometers
     Rad2Km = EarthRadiusKm 
@@ -1680,7 +2349,7 @@ class geoCalculator:
     Deg2Km = Deg2Rad * Rad2Km 
 
     def convertLatToRadians(self,lat):
-        return math.log(math.tan((90.0 + lat) * self.Deg2HalfRad))
+        return numpy.log(numpy.tan((90.0 + lat) * self.Deg2HalfRad)) # works for single values and arrays
 
     def distanceBetweenLats(self,lat1, lat2):
         r1 =self.convertLatToRadians(lat1) # lat1 in radians
@@ -319,6 +319,23 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.convertNoData = False
         self.noDataValue = None
 
+    def initPointStatistics(self):
+        self.pointStatistics = [
+            ("Mean of the point values", "mean"),
+            ("Sum of the point values", "sum"),
+            ("Number of points", "count"),
+            ("Minimum of the point values", "min"),
+            ("Maximum of the point values", "max")
+        ]
+        self.pointStatistic = q2u.pointStatistic
+
+    def initOutputFormats(self):
+        self.outputFormats = [
+            ("CSV", "csv"),
+            ("Binary (ur-scape .bin)", "bin")
+        ]
+        self.outputFormat = q2u.outputFormat
+
     def initNetworkMap(self):
         self.roadClasses = ["Default", "Custom"]
         
@@ -339,6 +356,8 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.initMaxPatchSize()
         self.initResamplingMthd()
         self.initNoDatas()
+        self.initPointStatistics()
+        self.initOutputFormats()
         self.initNetworkMap()
         self.initCheckboxes()
 
@@ -411,6 +430,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.initCmbBoxUI(self.colors, self.cmbLayerColor, self.onLayerColorChanged)
         # Add resampling methods
         self.initCmbBoxUI(self.resamplingMthds, self.cmbResamplingMthd, self.onResamplingMthdChanged)
+        # Add point statistics
+        self.initCmbBoxUI(self.pointStatistics, self.cmbPointStatistic, self.onPointStatisticChanged)
+        # Add output formats
+        self.initCmbBoxUI(self.outputFormats, self.cmbOutputFormat, self.onOutputFormatChanged)
 
         self.initNoDataUI()
         self.initNetworkMapUI()
@@ -432,6 +455,8 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.cmbResamplingMthd.currentIndexChanged.connect(self.onResamplingMthdChanged)
         self.cmbNoDataCalculation.currentIndexChanged.connect(self.onNoDataCalculationChanged)
         self.chkNoDataList.stateChanged.connect(self.onChkNoDataListChanged)
+        self.cmbPointStatistic.currentIndexChanged.connect(self.onPointStatisticChanged)
+        self.cmbOutputFormat.currentIndexChanged.connect(self.onOutputFormatChanged)
         self.cmbRoadClasses.currentIndexChanged.connect(self.onRoadClassesChanged)
         self.btnCancel.clicked.connect(self.onCancel)
         self.btnPrevSettings.clicked.connect(self.onPrevSettings)
@@ -490,6 +515,7 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.cmbShapefileField.setCurrentIndex(index)
         if self.shapefileFields:
             self.selectedShapefileField = self.shapefileFields[index]
+        self.updatePointStatisticUI()
 
     def onOpenAttributeTable(self):
         iface.showAttributeTable(iface.activeLayer())
@@ -596,6 +622,12 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.convertNoData = self.noDataAggregations[index][1]
         #print("ConvertNoData: " + str(self.convertNoData))
 
+    def onPointStatisticChanged(self, index):
+        self.pointStatistic = self.pointStatistics[index][1]
+
+    def onOutputFormatChanged(self, index):
+        self.outputFormat = self.outputFormats[index][1]
+
     def onNoDataTextChanged(self, text):
         currTextLen = len(text)
         
@@ -742,6 +774,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.qgsSettings.setValue("list", self.chkNoDataList.isChecked())
         self.qgsSettings.setValue("noDataValue", self.txtNoData.text())
         self.qgsSettings.setValue("noDataValues", list(txtNoData.text() for txtNoData in self.txtNoDatas))
+        # Point Statistic
+        self.qgsSettings.setValue("pointStatistic", self.cmbPointStatistic.currentIndex())
+        # Output Format
+        self.qgsSettings.setValue("outputFormat", self.cmbOutputFormat.currentIndex())
         # Network Maps
         self.qgsSettings.setValue("roadClasses", self.cmbRoadClasses.currentIndex())
         self.qgsSettings.setValue("customNetworkMapVals", self.customNetworkMapVals)
@@ -801,6 +837,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.loadPrevCmbIndex(self.cmbNoDataCalculation, self.qgsSettings.value("noDataCalculation"), self.cmbNoDataCalculation.currentIndex())
         # No Data Value + List
         self.loadPrevNoDataValuesList(self.qgsSettings.value("list"), self.qgsSettings.value("noDataValue"), self.qgsSettings.value("noDataValues"))
+        # Point Statistic
+        self.loadPrevCmbIndex(self.cmbPointStatistic, self.qgsSettings.value("pointStatistic"), self.cmbPointStatistic.currentIndex())
+        # Output Format
+        self.loadPrevCmbIndex(self.cmbOutputFormat, self.qgsSettings.value("outputFormat"), self.cmbOutputFormat.currentIndex())
         # Network Maps
         self.loadPrevCmbIndex(self.cmbRoadClasses, self.qgsSettings.value("roadClasses"), self.cmbRoadClasses.currentIndex())
         self.loadPrevNetworkMap(self.qgsSettings.value("customNetworkMapVals"), self.defaultNetworkMapVals)
@@ -898,6 +938,22 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         if self.shapefileFields:
             self.selectedShapefileField = self.shapefileFields[0]
 
+    def updatePointStatisticUI(self):
+        # Point statistic is only used for data layers of points with a numeric
+        # field, non numeric fields are exported as categories
+        layer = self.selectedInputLayer
+        isNumericPoints = False
+        if self.selectedOutputType == 0 and isinstance(layer, QgsVectorLayer) and layer.geometryType() == 0:
+            fieldIndex = layer.fields().indexOf(self.selectedShapefileField or "")
+            isNumericPoints = fieldIndex >= 0 and layer.fields().field(fieldIndex).isNumeric()
+
+        if isNumericPoints:
+            self.lblPointStatistic.show()
+            self.cmbPointStatistic.show()
+        else:
+            self.lblPointStatistic.hide()
+            self.cmbPointStatistic.hide()
+
     def updateOutputType(self, enabled):
         # Reachability should only be available for vector type lines
         self.cmbOutputType.clear()
@@ -1104,6 +1160,8 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         print("ForReachability: " + str(q2u.forReachability))
         print("ActiveGeomFix: " + str(q2u.activeGeometryFix))
         print("ClipToNoData: " + str(q2u.clipToNoData))
+        print("PointStatistic: " + str(q2u.pointStatistic))
+        print("OutputFormat: " + str(q2u.outputFormat))
         print("NetworkMap: " + str(q2u.networkMap))
         
     def setq2uParams(self):
@@ -1162,6 +1220,8 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         q2u.forReachability = self.forReachability
         q2u.activeGeometryFix = self.chkFixGeometry.isChecked()
         q2u.clipToNoData = self.chkClipToNoDataOuterArea.isChecked()
+        q2u.pointStatistic = self.pointStatistic
+        q2u.outputFormat = self.outputFormat
         q2u.networkMap = self.networkMap
         
         # self.printq2uParams()
@@ -1316,7 +1376,8 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
             for i in range(len(self.networkMapVals) - 1):
                 QWidget.setTabOrder(self.networkMapVals[i], self.networkMapVals[i + 1])
             
-            QWidget.setTabOrder(self.networkMapVals[-1], self.txtRasterBand)
+            QWidget.setTabOrder(self.networkMapVals[-1], self.cmbOutputFormat)
+            QWidget.setTabOrder(self.cmbOutputFormat, self.txtRasterBand)
 
     def resetTask(self):
         self.progressBar.setValue(int(0))
@@ -1427,6 +1488,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.lblRoadClasses.hide()
         self.cmbRoadClasses.hide()
         self.wgtNetworkMap.hide()
+        self.lblPointStatistic.hide()
+        self.cmbPointStatistic.hide()
+        self.lblOutputFormat.show()
+        self.cmbOutputFormat.show()
 
         # Custom widgets
         self.onResolutionChanged(self.cmbRes.currentIndex())
@@ -1488,6 +1553,9 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.lblRoadClasses.hide()
         self.cmbRoadClasses.hide()
         self.wgtNetworkMap.hide()
+        self.updatePointStatisticUI()
+        self.lblOutputFormat.show()
+        self.cmbOutputFormat.show()
         
         # Custom widgets
         self.onResolutionChanged(self.cmbRes.currentIndex())
@@ -1550,6 +1618,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.lblRoadClasses.show()
         self.cmbRoadClasses.show()
         self.wgtNetworkMap.show()
+        self.lblPointStatistic.hide()
+        self.cmbPointStatistic.hide()
+        self.lblOutputFormat.show()
+        self.cmbOutputFormat.show()
         
         # Custom widgets
         self.wgtCustomRes.hide()
@@ -1610,6 +1682,10 @@ class Qgis2UrscapeUIDialog(QtWidgets.QDialog):
         self.lblRoadClasses.hide()
         self.cmbRoadClasses.hide()
         self.wgtNetworkMap.hide()
+        self.lblPointStatistic.hide()
+        self.cmbPointStatistic.hide()
+        self.lblOutputFormat.hide()
+        self.cmbOutputFormat.hide()
         
         # Custom widgets
         self.wgtCustomRes.hide()
@@ -0,0 +1,64 @@
+"""Time the aggregation of aggregateAndSum with 1, 2, 4 and 8 worker processes.
+Run with the QGIS python: python test/benchmark_aggregation_workers.py [size] [factor]"""
+import os, sys, shutil, tempfile, time, concurrent.futures, multiprocessing
+import numpy
+from utilities import getExporter
+
+def createRaster(q2u, path, size):
+    """ random Float32 raster of size x size cells in degrees"""
+    ds = q2u.gdal.GetDriverByName('GTiff').Create(path, size, size, 1, q2u.gdal.GDT_Float32)
+    ds.SetGeoTransform((106.0, 0.0001, 0, -6.0, 0, -0.0001))
+    band = ds.GetRasterBand(1)
+    rowsPerWrite = max(1, 10000000 // size)
+    for yStart in range(0, size, rowsPerWrite):
+        rows = min(rowsPerWrite, size - yStart)
+        band.WriteArray(numpy.random.default_rng(yStart).random((rows, size), dtype='f4'), 0, yStart)
+    band.SetNoDataValue(float('nan'))
+    ds.FlushCache()
+    ds = None
+
+def aggregate(q2u, path, blocks, cols, mode, workers):
+    """ workers get aggregateStrip from the aggregation module, as in aggregateAndSum"""
+    import aggregation
+    if workers == 1:
+        return [aggregation.aggregateStrip(path, 1, blockRows, cols, mode, 'f4') for blockRows in blocks]
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(q2u.getWorkerPython())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(aggregation.aggregateStrip, path, 1, blockRows, cols, mode, 'f4') for blockRows in blocks]
+        return [future.result() for future in futures]
+
+def main():
+    q2u = getExporter()
+    if q2u is None:
+        sys.exit("QGIS and GDAL are needed")
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    factor = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "input.tif")
+        createRaster(q2u, path, size)
+
+        """ same weights and blocks of rows as aggregateAndSum (absolute units, mean)"""
+        layer = object.__new__(q2u.CheckLayer)
+        outCount = size // factor
+        rows = layer.getAggregationWeights(-6.0, -0.0001 * factor, outCount, -6.0, -0.0001, size, factor, True, True)
+        cols = layer.getAggregationWeights(106.0, 0.0001 * factor, outCount, 106.0, 0.0001, size, factor, True, False)
+        rowsPerBlock = max(1, int(q2u.aggregationBlockSize / max(1, rows[0].shape[1] * size)))
+        blocks = [tuple(weights[outFromY:outFromY + rowsPerBlock] for weights in rows) for outFromY in range(0, outCount, rowsPerBlock)]
+        mode = (False, False, 1, False)
+
+        print("%d x %d cells aggregated by %d in %d blocks, %d CPUs, worker python %s"
+              % (size, size, factor, len(blocks), os.cpu_count(), q2u.getWorkerPython()))
+        expected = None
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            result = numpy.concatenate(aggregate(q2u, path, blocks, cols, mode, workers))
+            seconds = time.perf_counter() - start
+            expected = result if expected is None else expected
+            print("%d workers: %.2f s%s" % (workers, seconds, "" if numpy.array_equal(result, expected, equal_nan=True) else " (different result)"))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
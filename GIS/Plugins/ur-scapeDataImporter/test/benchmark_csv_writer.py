@@ -0,0 +1,76 @@
+"""Compare the throughput of the per cell csv loop writeGridToFile used before
+with FileWriter.writeValuesBlock on a synthetic band. The whole band as strings
+doesn't fit in memory for the loop, so it is timed on the first rows only.
+Run with the QGIS python: python test/benchmark_csv_writer.py [size] [loopRows]"""
+import os, sys, shutil, tempfile, time
+import numpy
+from utilities import getExporter
+
+def createBand(size, rows, yStart):
+    """ random Float32 values with about 10% noData (NaN)"""
+    rng = numpy.random.default_rng(yStart)
+    values = rng.random((rows, size), dtype='f4') * 1000
+    values[rng.random((rows, size)) < 0.1] = float('nan')
+    return values
+
+def writeLoop(path, values):
+    """ writeGridToFile before it was vectorized: the band as strings, one write per cell"""
+    masks = ~numpy.isfinite(values)
+    strings = values.astype(str)
+    with open(path, 'w', newline='', encoding='utf-16') as output_file:
+        for y in range(0, values.shape[0]):
+            for x in range(0, values.shape[1]):
+                value = strings[y,x] if not masks[y,x] else "0"
+                mask = "1" if not masks[y,x] else "0"
+                output_file.write(value + "," + mask + "\n")
+
+def writeBlocks(q2u, path, size, rows):
+    """ writeGridToFile now: blocks of writeBlockSize cells formatted at once"""
+    writer = object.__new__(q2u.FileWriter)
+    rowsPerBlock = max(1, int(q2u.writeBlockSize / size))
+    with open(path, 'w', newline='', encoding='utf-16') as output_file:
+        for yStart in range(0, rows, rowsPerBlock):
+            values = createBand(size, min(rowsPerBlock, rows - yStart), yStart)
+            writer.writeValuesBlock(output_file, values, ~numpy.isfinite(values))
+
+def main():
+    q2u = getExporter()
+    if q2u is None:
+        sys.exit("QGIS and GDAL are needed")
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    loopRows = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    folder = tempfile.mkdtemp()
+    try:
+        rowsPerBlock = max(1, int(q2u.writeBlockSize / size))
+        loopRows = max(rowsPerBlock, loopRows // rowsPerBlock * rowsPerBlock) # same rows for both
+        print("%d x %d cells, loop timed on %d rows, blocks of %d rows" % (size, size, loopRows, rowsPerBlock))
+
+        """ band creation is timed apart, it is not part of the writing"""
+        start = time.perf_counter()
+        for yStart in range(0, size, rowsPerBlock):
+            createBand(size, min(rowsPerBlock, size - yStart), yStart)
+        createSeconds = time.perf_counter() - start
+
+        loopPath, blockPath = os.path.join(folder, "loop.csv"), os.path.join(folder, "blocks.csv")
+        values = numpy.concatenate([createBand(size, rowsPerBlock, yStart) for yStart in range(0, loopRows, rowsPerBlock)])
+        start = time.perf_counter()
+        writeLoop(loopPath, values)
+        loopSeconds = time.perf_counter() - start
+        writeBlocks(q2u, blockPath, size, loopRows)
+        with open(loopPath, 'rb') as loopFile, open(blockPath, 'rb') as blockFile:
+            isSame = loopFile.read() == blockFile.read()
+
+        start = time.perf_counter()
+        writeBlocks(q2u, blockPath, size, size)
+        blockSeconds = time.perf_counter() - start - createSeconds
+
+        loopRate = loopRows * size / loopSeconds
+        blockRate = size * size / blockSeconds
+        print("loop: %.0f cells/s (%.0f s for the whole band)" % (loopRate, size * size / loopRate))
+        print("blocks: %.0f cells/s (%.1f s for the whole band, %.1f MB)" % (blockRate, blockSeconds, os.path.getsize(blockPath) / 1048576.0))
+        print("%.1fx faster, %s output on the loop rows" % (blockRate / loopRate, "same" if isSame else "DIFFERENT"))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Time writing and reading temp rasters created as before (striped, uncompressed)
+and by CheckLayer.createTempRaster with each tempCompression, and compare file sizes.
+Run with the QGIS python: python test/benchmark_temp_rasters.py [size]"""
+import os, sys, shutil, tempfile, time
+import numpy
+from utilities import getExporter
+
+def createStrip(size, yStart, rows):
+    """ smooth Float32 surface with noise and noData (NaN) areas, like a
+    warped population raster"""
+    y, x = numpy.mgrid[yStart:yStart + rows, 0:size].astype('f4') / size
+    values = 1000 * numpy.sin(6 * x) * numpy.cos(4 * y) + numpy.random.default_rng(yStart).normal(0, 5, (rows, size)).astype('f4')
+    values[(x - 0.7) ** 2 + (y - 0.3) ** 2 < 0.04] = float('nan')
+    values[:, :size // 10] = float('nan')
+    return values
+
+def writeRaster(raster, size, rowsPerStrip):
+    band = raster.GetRasterBand(1)
+    band.SetNoDataValue(float('nan'))
+    for yStart in range(0, size, rowsPerStrip):
+        band.WriteArray(createStrip(size, yStart, min(rowsPerStrip, size - yStart)), 0, yStart)
+    band.FlushCache()
+
+def readRaster(q2u, path, size, rowsPerStrip, patchSize):
+    """ read in strips of rows (aggregation, noData index) and in square windows (patches)"""
+    ds = q2u.gdal.Open(path)
+    band = ds.GetRasterBand(1)
+    total = 0.0
+    for yStart in range(0, size, rowsPerStrip):
+        total += numpy.nansum(band.ReadAsArray(0, yStart, size, min(rowsPerStrip, size - yStart)))
+    for yStart in range(0, size, patchSize):
+        for xStart in range(0, size, patchSize):
+            total += numpy.nansum(band.ReadAsArray(xStart, yStart, min(patchSize, size - xStart), min(patchSize, size - yStart)))
+    return total
+
+def main():
+    q2u = getExporter()
+    if q2u is None:
+        sys.exit("QGIS and GDAL are needed")
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rowsPerStrip = max(1, q2u.readBlockSize // size)
+    folder = tempfile.mkdtemp()
+    previousCompression = q2u.tempCompression
+    try:
+        layer = object.__new__(q2u.CheckLayer)
+        print("%d x %d Float32 cells, strips of %d rows, GDAL %s" % (size, size, rowsPerStrip, q2u.gdal.__version__))
+        for compression in (None, "NONE", "DEFLATE", "ZSTD"):
+            path = os.path.join(folder, "temp.tif")
+            start = time.perf_counter()
+            if compression is None:
+                label = "striped, uncompressed (before)"
+                raster = q2u.gdal.GetDriverByName('GTiff').Create(path, size, size, 1, q2u.gdal.GDT_Float32)
+            else:
+                q2u.tempCompression = compression
+                options = layer.getCreationOptions(q2u.gdal.GDT_Float32)
+                label = "tiled, " + ([option for option in options if option.startswith('COMPRESS=')] or ['COMPRESS=NONE'])[0]
+                raster = layer.createTempRaster(path, size, size, q2u.gdal.GDT_Float32)
+            writeRaster(raster, size, rowsPerStrip)
+            raster = None
+            writeSeconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            readRaster(q2u, path, size, rowsPerStrip, 2000)
+            readSeconds = time.perf_counter() - start
+            print("%-32s write %6.2f s, read %6.2f s, %8.1f MB" % (label, writeSeconds, readSeconds, os.path.getsize(path) / 1048576.0))
+            q2u.gdal.GetDriverByName('GTiff').Delete(path)
+    finally:
+        q2u.tempCompression = previousCompression
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import contextlib, importlib.util, io, math, os, shutil, subprocess, sys, tempfile, unittest
+import numpy
+from utilities import getExporter, setGlobal, PLUGIN_DIR
+
+q2u = getExporter()
+
+def aggregateLoop(inData, gt, scale, inputCRS, isRelative, summary, unitsMultiply, convertNoData):
+    """ nested loop of aggregateAndSum before it was vectorized, kept as the reference"""
+    inMinX, inDegPerCellX, inMaxY, inDegPerCellY = gt[0], gt[1], gt[3], gt[5]
+    inCountY, inCountX = inData.shape
+    outCountX = int(math.floor(inCountX / scale))
+    outCountY = int(math.floor(inCountY / scale))
+    outDegPerCellX = inDegPerCellX * scale
+    outDegPerCellY = inDegPerCellY * scale
+    areaMultX = (1 / inDegPerCellX)
+    areaMultY = (1 / inDegPerCellY)
+    calculator = q2u.geoCalculator()
+
+    outData = numpy.full((outCountY, outCountX), float("nan"))
+    for outY in range(0, outCountY):
+        outN = inMaxY + outY * outDegPerCellY
+        outS = outN + outDegPerCellY
+        inFromY = int(math.floor(outY * scale))
+        inToY = int(math.ceil((outY + 1) * scale))
+        for outX in range(0, outCountX):
+            outW = inMinX + outX * outDegPerCellX
+            outE = outW + outDegPerCellX
+            inFromX = int(math.floor(outX * scale))
+            inToX = int(math.ceil((outX + 1) * scale))
+            aggregatedValue = 0
+            aggregatedSqKm = 0
+            aggregatedRatio = 0
+            for inY in range(inFromY, inToY):
+                inN = inMaxY + inY * inDegPerCellY
+                inS = inN + inDegPerCellY
+                south = max(outS, inS)
+                north = min(outN, inN)
+                if inputCRS == 'EPSG:4326':
+                    heightKm = calculator.distanceBetweenLats(south, north)
+                else:
+                    heightKm = (south - north) * 0.001
+                for inX in range(inFromX, inToX):
+                    inValue = inData[inY, inX]
+                    if math.isnan(inValue):
+                        if not convertNoData:
+                            aggregatedSqKm = 0
+                            break # only leaves this input row, see testNoDataWindowIsNoData
+                        else:
+                            continue
+                    inW = inMinX + inX * inDegPerCellX
+                    inE = inW + inDegPerCellX
+                    west = max(outW, inW)
+                    east = min(outE, inE)
+                    if inputCRS == 'EPSG:4326':
+                        widthKm = calculator.distanceBetweenLons(west, east)
+                    else:
+                        widthKm = (west - east) * 0.001
+                    areaRatio = (east - west) * areaMultX * (south - north) * areaMultY
+                    intersectionAreaSqKm = widthKm * heightKm
+                    aggregatedSqKm += intersectionAreaSqKm
+                    aggregatedRatio += areaRatio
+                    if isRelative:
+                        aggregatedValue += inValue * intersectionAreaSqKm
+                    else:
+                        aggregatedValue += inValue * areaRatio
+
+            if aggregatedSqKm == 0:
+                outData[outY, outX] = float("nan")
+            elif isRelative and not summary:
+                outData[outY, outX] = aggregatedValue
+            elif isRelative and summary:
+                outData[outY, outX] = aggregatedValue * unitsMultiply
+            elif not isRelative and summary:
+                outData[outY, outX] = aggregatedValue
+            else:
+                outData[outY, outX] = aggregatedValue / aggregatedRatio
+    return outData
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class AggregationTest(unittest.TestCase):
+    "aggregateAndSum must give the results of the nested loop it replaced"
+
+    degrees = ('EPSG:4326', (106.0, 0.001, 0, -6.0, 0, -0.001))
+    metres = ('EPSG:3395', (11800000.0, 100.0, 0, -660000.0, 0, -100.0))
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        setGlobal(self, q2u, 'workingPrecision', "Float64")
+        setGlobal(self, q2u, 'aggregationWorkers', 1)
+        setGlobal(self, q2u, 'inMemoryPipeline', False)
+        setGlobal(self, q2u, 'name', "aggregated.tif")
+        self.values = numpy.random.default_rng(13).uniform(0, 1000, (12, 15))
+        self.noDataValues = self.values.copy()
+        self.noDataValues[0, 0] = float("nan") # first row of a window
+        self.noDataValues[3:6, 6:9] = float("nan") # whole window
+        self.noDataValues[11, 14] = float("nan") # last row of a window
+
+    def createRaster(self, values, crs, gt):
+        path = os.path.join(self.folder, "input.tif")
+        ds = q2u.gdal.GetDriverByName('GTiff').Create(path, values.shape[1], values.shape[0], 1, q2u.gdal.GDT_Float64)
+        ds.SetGeoTransform(gt)
+        srs = q2u.osr.SpatialReference()
+        srs.ImportFromEPSG(int(crs.split(':')[1]))
+        ds.SetProjection(srs.ExportToWkt())
+        ds.GetRasterBand(1).WriteArray(values)
+        ds.GetRasterBand(1).SetNoDataValue(float("nan"))
+        ds.FlushCache()
+        ds = None
+        return path
+
+    def aggregate(self, values, grid, scale, isRelative, summary, convertNoData):
+        crs, gt = grid
+        setGlobal(self, q2u, 'convertNoData', convertNoData)
+        setup = object.__new__(q2u.Setup)
+        setup.task = None
+        setup.isCategorized = False
+        setup.isPoint = False
+        setup.inputCRS = crs
+        setup.aggregationRes = gt[1] * scale
+        setup.isRelative = isRelative
+        setup.summary = summary
+        setup.unitsMultiply = 0.01
+        layer = object.__new__(q2u.CheckLayer)
+        layer.memoryFiles = {}
+        layer.memorySize = 0
+        path = layer.aggregateAndSum(setup, self.createRaster(values, crs, gt))
+        result = q2u.gdal.Open(path).ReadAsArray()
+        q2u.gdal.GetDriverByName('GTiff').Delete(path)
+        return result
+
+    def assertSameAsLoop(self, values, grid, scale, isRelative, summary, convertNoData):
+        result = self.aggregate(values, grid, scale, isRelative, summary, convertNoData)
+        scale = grid[1][1] * scale / grid[1][1] # as aggregateAndSum gets it from the resolution
+        expected = aggregateLoop(values, grid[1], scale, grid[0], isRelative, summary, 0.01, convertNoData)
+        numpy.testing.assert_allclose(result, expected, rtol=1e-9, equal_nan=True)
+
+    def testAllModes(self):
+        for grid in (self.degrees, self.metres):
+            for scale in (3, 2.5):
+                for isRelative in (False, True):
+                    for summary in (False, True):
+                        for values in (self.values, self.noDataValues):
+                            with self.subTest(crs=grid[0], scale=scale, isRelative=isRelative, summary=summary, noData=values is self.noDataValues):
+                                self.assertSameAsLoop(values, grid, scale, isRelative, summary, True)
+
+    def testNoDataWithoutConvert(self):
+        """ without convertNoData windows with a noData cell are noData, the
+        others keep the values of the loop"""
+        for isRelative in (False, True):
+            for summary in (False, True):
+                with self.subTest(isRelative=isRelative, summary=summary):
+                    result = self.aggregate(self.noDataValues, self.degrees, 3, isRelative, summary, False)
+                    expected = aggregateLoop(self.values, self.degrees[1], 3, 'EPSG:4326', isRelative, summary, 0.01, False)
+                    hasNoData = numpy.isnan(self.noDataValues).reshape(4, 3, 5, 3).any(axis=(1, 3))
+                    expected[hasNoData] = float("nan")
+                    numpy.testing.assert_allclose(result, expected, rtol=1e-9, equal_nan=True)
+
+    def testNoDataWindowIsNoData(self):
+        """ Behaviour change: the loop only left the input row of a noData cell
+        (its "inY = inToY" did not stop the row loop), so a window with noData
+        above its last row got the value of the rows after it. Such windows
+        are now noData, as the loop intended"""
+        loop = aggregateLoop(self.noDataValues, self.degrees[1], 3, 'EPSG:4326', False, True, 0.01, False)
+        result = self.aggregate(self.noDataValues, self.degrees, 3, False, True, False)
+        self.assertFalse(math.isnan(loop[0, 0]))
+        self.assertTrue(math.isnan(result[0, 0]))
+        self.assertTrue(math.isnan(loop[3, 4]))
+        self.assertTrue(math.isnan(result[3, 4]))
+
+    def testWorkerProcesses(self):
+        """ the blocks are aggregated by the workers, not by the single process fallback"""
+        setGlobal(self, q2u, 'aggregationBlockSize', 45) # one output row per block
+        expected = self.aggregate(self.noDataValues, self.degrees, 3, True, False, False)
+        setGlobal(self, q2u, 'aggregationWorkers', 2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = self.aggregate(self.noDataValues, self.degrees, 3, True, False, False)
+        self.assertNotIn("single process", output.getvalue())
+        numpy.testing.assert_array_equal(result, expected)
+
+@unittest.skipIf(importlib.util.find_spec('osgeo') is None, "GDAL is needed")
+class WorkerModuleTest(unittest.TestCase):
+    "Aggregation workers import the aggregation module, which must not import QGIS"
+
+    def testNoQgisImport(self):
+        code = "import sys, aggregation; print(sorted(m for m in sys.modules if m.split('.')[0] in ('qgis', 'processing', 'PyQt5')))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=PLUGIN_DIR, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,279 @@
+import os, shutil, struct, tempfile, unittest
+import numpy
+from utilities import getExporter, setGlobal
+
+q2u = getExporter()
+
+def graphEdgesLoop(dataMain, dataVarify, oldGraphData, oldGraphVarify, gt, cl, lenght):
+    """ csv lines of the per cell loop of appendGraphFile before it was vectorized,
+    kept as the reference"""
+    countY, countX = dataMain.shape
+    minX, minY, w, h = gt[0], gt[3], gt[1], gt[5]
+    lenghtDiagonal = (lenght**2+lenght**2)**(.5)
+    lines = []
+    metrix = [[-1, -1], [-1,0], [-1,1], [0,-1]]
+    isOldValue = [False,False,False,False]
+    for y in range(1, countY):
+        for x in range(1, countX-1):
+            if not dataMain[y,x] > 0:
+                continue
+            source = str(y*(countX)+x)
+            halfW,halfH = w*0.5, h*0.5
+            X1,Y1 = str(minX + w*x + halfW),str(minY + h*y + halfH)
+            isOtherValue = [dataMain[y + m[0] , x+ m[1]]>0 for m in metrix]
+            if oldGraphData is not None:
+                isOldValue = [oldGraphData[y + m[0] , x+ m[1]]>0 for m in metrix]
+
+            if isOtherValue[0] or isOldValue[0]:
+                dataCheck = dataVarify if isOtherValue[0] else oldGraphVarify
+                if dataCheck[(y-1)*3+2,(x-1)*3+2] > 0 or dataCheck[(y)*3,(x-1)*3+2] > 0 or dataCheck[(y-1)*3+2,(x)*3] > 0 or cl == "16":
+                    target = str(y*countX-countX+x-1)
+                    X2, Y2 = str(minX + w*(x-1) + halfW),str(minY + h*(y-1)+ halfH)
+                    lines.append(str(lenghtDiagonal)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl)
+            if isOtherValue[1] or isOldValue[1]:
+                dataCheck = dataVarify if isOtherValue[1] else oldGraphVarify
+                if dataCheck[(y-1)*3+2,(x)*3+0] > 0 or dataCheck[(y-1)*3+2,(x)*3+1] > 0 or dataCheck[(y-1)*3+2,(x)*3+2] > 0 or cl == "16":
+                    target = str(y*countX-countX+x)
+                    X2, Y2 = str(minX + w*(x) + halfW),str(minY + h*(y-1)+ halfH)
+                    lines.append(str(lenght)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl)
+            if isOtherValue[2] or isOldValue[2]:
+                dataCheck = dataVarify if isOtherValue[2] else oldGraphVarify
+                if dataCheck[(y-1)*3+2,(x+1)*3+0] > 0 or dataCheck[(y-1)*3+2,(x)*3+2] > 0 or dataCheck[(y)*3+0,(x+1)*3+0] > 0 or cl == "16":
+                    target = str(y*countX-countX+(x+1))
+                    X2, Y2 = str(minX + w*(x+1) + halfW),str(minY + h*(y-1)+ halfH)
+                    lines.append(str(lenghtDiagonal)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl)
+            if isOtherValue[3] or isOldValue[3]:
+                dataCheck = dataVarify if isOtherValue[3] else oldGraphVarify
+                if dataCheck[(y)*3+0,(x-1)*3+2] > 0 or dataCheck[(y)*3+1,(x-1)*3+2] > 0 or dataCheck[(y)*3+2,(x-1)*3+2] > 0 or cl == "16":
+                    target = str(y*countX+(x-1))
+                    X2, Y2 = str(minX + w*(x-1) + halfW),str(minY + h*(y)+ halfH)
+                    lines.append(str(lenght)+","+source+"," + target+","+X1+","+Y1+","+X2+","+Y2 + ","+ cl)
+    return lines
+
+class GraphNode:
+    "GraphNode of ur-scape, links are kept in the order they were added"
+
+    def __init__(self, longitude, latitude, classifications, index):
+        self.longitude = longitude
+        self.latitude = latitude
+        self.classifications = classifications
+        self.index = index
+        self.links = []
+        self.linkDistances = []
+        self.linkClassifications = []
+
+    def addLinkData(self, link, distance, classification):
+        for i in range(len(self.links)):
+            if self.links[i] is link and self.linkClassifications[i] == classification:
+                self.linkDistances[i] = min(distance, self.linkDistances[i])
+                return
+        self.links.append(link)
+        self.linkDistances.append(distance)
+        self.linkClassifications.append(classification)
+
+    def removeLinkData(self, link, classification):
+        for i in range(len(self.links) - 1, -1, -1):
+            if self.links[i] is link and self.linkClassifications[i] == classification:
+                del self.links[i], self.linkDistances[i], self.linkClassifications[i]
+                return
+
+def addLink(nodeA, nodeB, distance, classification):
+    """ GraphNode.AddLink, classifications are split in single bits"""
+    for bit in (1, 2, 4, 8, 16):
+        if classification & bit:
+            nodeA.addLinkData(nodeB, distance, bit)
+            nodeB.addLinkData(nodeA, distance, bit)
+
+def removeLink(nodeA, nodeB, classification):
+    nodeA.removeLinkData(nodeB, classification)
+    nodeB.removeLinkData(nodeA, classification)
+
+def graphCsvToBin(lines):
+    """ bytes GraphDataIO.SaveBin writes for the graph GraphDataIO.ParseCsv
+    builds from the csv lines (before RemoveExtraLongLinks, which LoadBin runs)"""
+    graph = {'cellSizeX': float('inf'), 'cellSizeY': float('inf'), 'west': 180.0, 'east': -180.0, 'north': -180.0, 'south': 180.0}
+    nodes, nodeList = {}, []
+
+    def getNode(nodeId, x, y, classification):
+        if nodeId in nodes:
+            nodes[nodeId].classifications |= classification
+        else:
+            nodes[nodeId] = GraphNode(x, y, classification, nodeId)
+            nodeList.append(nodes[nodeId])
+            graph['west'], graph['east'] = min(graph['west'], x), max(graph['east'], x)
+            graph['north'], graph['south'] = max(graph['north'], y), min(graph['south'], y)
+        return nodes[nodeId]
+
+    def addCsvLink(sourceId, targetId, x1, y1, x2, y2, distance, classification):
+        sourceNode = getNode(sourceId, x1, y1, classification)
+        targetNode = getNode(targetId, x2, y2, classification)
+        addLink(sourceNode, targetNode, distance, classification)
+        if abs(x2 - x1) > 0.00001:
+            graph['cellSizeX'] = min(graph['cellSizeX'], abs(x2 - x1))
+        if abs(y2 - y1) > 0.00001:
+            graph['cellSizeY'] = min(graph['cellSizeY'], abs(y2 - y1))
+
+    for line in lines[1:]:
+        cells = line.split(',')
+        sourceId, targetId = int(cells[1]), int(cells[2])
+        if sourceId == targetId:
+            continue
+        classification = int(cells[7])
+        # the csv has the shortest repr of the float64 length, rounded to float32 as the writer does
+        distance = numpy.float32(float(cells[0]))
+        x1, y1, x2, y2 = [float(cell) for cell in cells[3:7]]
+        if classification >= 16:
+            addCsvLink(-sourceId, -targetId, x1, y1, x2, y2, distance, 16)
+            classification -= 16
+        if classification > 0:
+            addCsvLink(sourceId, targetId, x1, y1, x2, y2, distance, classification)
+
+    graph['east'] += graph['cellSizeX'] * 0.5
+    graph['west'] -= graph['cellSizeX'] * 0.5
+    graph['north'] += graph['cellSizeY'] * 0.5
+    graph['south'] -= graph['cellSizeY'] * 0.5
+
+    indexToNode, highwayList = {}, []
+    kX, kY = 1.0 / graph['cellSizeX'], 1.0 / graph['cellSizeY']
+    countX = int(round((graph['east'] - graph['west']) * kX))
+    for node in reversed(nodeList):
+        index = int((node.longitude - graph['west']) * kX) + countX * int((graph['north'] - node.latitude) * kY)
+        if node.classifications == 16:
+            if index not in highwayList:
+                highwayList.append(index)
+            index = -index
+        indexToNode.setdefault(index, node)
+        node.index = index
+
+    # connect highways to the other roads with highway link links
+    for index in highwayList:
+        linkNode = indexToNode.get(index)
+        if linkNode is None or linkNode.classifications < 8:
+            continue
+        highwayNode = indexToNode[-index]
+        for i in range(len(linkNode.links) - 1, -1, -1):
+            if linkNode.linkClassifications[i] == 8:
+                other = linkNode.links[i]
+                addLink(highwayNode, other, linkNode.linkDistances[i], 8)
+                removeLink(linkNode, other, 8)
+        if linkNode.links:
+            linkNode.classifications &= ~8
+        else:
+            nodeList.remove(linkNode)
+            del indexToNode[index]
+
+    data = struct.pack('<IIdddddd', 0x600DF00D, 13, graph['west'], graph['east'], graph['north'], graph['south'], graph['cellSizeX'], graph['cellSizeY'])
+    data += struct.pack('<i', len(nodeList))
+    for node in nodeList:
+        data += struct.pack('<ddii', node.longitude, node.latitude, node.classifications, node.index)
+    for node in nodeList:
+        for link, distance, classification in zip(node.links, node.linkDistances, node.linkClassifications):
+            if link.index > node.index:
+                data += struct.pack('<iifi', node.index, link.index, distance, classification)
+    return data
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class GraphTest(unittest.TestCase):
+    "Reachability graphs of synthetic road grids with all road classes of networkMap"
+
+    gt = (106.0, 0.001, 0, -6.0, 0, -0.001)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        for key, value in (('name', "Roads"), ('location', "Palembang"), ('date', "2020"), ('onlyYear', False),
+                           ('resolution', "1"), ('forReachability', True), ('outputFormat', "csv")):
+            setGlobal(self, q2u, key, value)
+        self.setup = object.__new__(q2u.Setup)
+        self.setup.finalPath = self.folder
+
+    def createRaster(self, values, fileName, cellSize):
+        path = os.path.join(self.folder, fileName)
+        ds = q2u.gdal.GetDriverByName('GTiff').Create(path, values.shape[1], values.shape[0], 1, q2u.gdal.GDT_Float32)
+        ds.SetGeoTransform((self.gt[0], cellSize, 0, self.gt[3], 0, -cellSize))
+        ds.GetRasterBand(1).WriteArray(values)
+        ds.FlushCache()
+        ds = None
+        return path
+
+    def createRoads(self, seed, countX=14, countY=12):
+        """ random road raster and its 3x3 verify raster for each road class,
+        classes overlap so highway and highway link cells share nodes"""
+        rng = numpy.random.default_rng(seed)
+        roads = []
+        for key in q2u.networkMap:
+            main = (rng.random((countY, countX)) < 0.4).astype('f4')
+            varify = (numpy.kron(main, numpy.ones((3, 3))) * (rng.random((3 * countY, 3 * countX)) < 0.6)).astype('f4')
+            roads.append((key, main, varify))
+        return roads
+
+    def writeGraph(self, roads):
+        """ graph file written by FileWriter for the roads"""
+        writer = q2u.FileWriter(None, self.setup)
+        for key, main, varify in roads:
+            writer.appendGraphFile(self.createRaster(main, "main.tif", self.gt[1]), self.createRaster(varify, "varify.tif", self.gt[1] / 3), key)
+        if q2u.outputFormat == "bin":
+            writer.writeGraphToBin()
+        return writer.path
+
+    def getLoopLines(self, roads):
+        lenght = q2u.resolutionLevels[int(q2u.resolution)]
+        power = len(roads) - 1
+        lines = ["lenght,source,target,x1,y1,x2,y2,classification"]
+        oldMain = oldVarify = None
+        for key, main, varify in roads:
+            lines += graphEdgesLoop(main, varify, oldMain, oldVarify, self.gt, str(2 ** power), lenght)
+            oldMain, oldVarify = main, varify
+            power -= 1
+        return lines
+
+    def testCsvSameAsLoop(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                roads = self.createRoads(seed)
+                with open(self.writeGraph(roads)) as graphFile:
+                    lines = graphFile.read().splitlines()
+                self.assertGreater(len(lines), 1)
+                self.assertEqual(lines, self.getLoopLines(roads))
+
+    def testBinSameAsCsv(self):
+        """ the bin graph is the graph GraphDataIO builds from the csv graph"""
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                roads = self.createRoads(seed)
+                with open(self.writeGraph(roads)) as graphFile:
+                    lines = graphFile.read().splitlines()
+                setGlobal(self, q2u, 'outputFormat', "bin")
+                with open(self.writeGraph(roads), 'rb') as graphFile:
+                    self.assertEqual(graphFile.read(), graphCsvToBin(lines))
+                q2u.outputFormat = "csv"
+
+    def testHighwayLinks(self):
+        """ highway link nodes on highway cells are merged into the highway nodes"""
+        highway = numpy.zeros((6, 8), dtype='f4')
+        highway[3, 1:7] = 1
+        highwayLink = numpy.zeros((6, 8), dtype='f4')
+        highwayLink[1:4, 3] = 1
+        highwayLink[1, 4:6] = 1
+        roads = [(key, numpy.zeros((6, 8), dtype='f4')) for key in q2u.networkMap]
+        roads[0], roads[1] = (roads[0][0], highway), (roads[1][0], highwayLink)
+        roads = [(key, main, numpy.kron(main, numpy.ones((3, 3))).astype('f4')) for key, main in roads]
+
+        with open(self.writeGraph(roads)) as graphFile:
+            lines = graphFile.read().splitlines()
+        setGlobal(self, q2u, 'outputFormat', "bin")
+        with open(self.writeGraph(roads), 'rb') as graphFile:
+            data = graphFile.read()
+        self.assertEqual(data, graphCsvToBin(lines))
+
+        count = struct.unpack_from('<i', data, 56)[0]
+        nodes = numpy.frombuffer(data, dtype=[('x', '<f8'), ('y', '<f8'), ('classification', '<i4'), ('index', '<i4')], count=count, offset=60)
+        links = numpy.frombuffer(data, dtype=[('source', '<i4'), ('target', '<i4'), ('distance', '<f4'), ('classification', '<i4')], offset=60 + nodes.nbytes)
+        # the highway link node on the highway is removed, its links start at the highway node
+        highwayNodes = nodes['index'][nodes['classification'] == 16]
+        self.assertEqual(sorted(set(links['classification'].tolist())), [8, 16])
+        self.assertTrue(numpy.isin(links['source'][links['classification'] == 8], highwayNodes).any()
+                        or numpy.isin(links['target'][links['classification'] == 8], highwayNodes).any())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import glob, math, os, shutil, struct, tempfile, unittest
+import numpy
+from utilities import getExporter, setGlobal, BinaryReader
+
+q2u = getExporter()
+
+def parseBin(path):
+    """ GridDataIO.ParseBin (ParseBinHeader, ParseBinProperties and ParseBinValues)"""
+    br = BinaryReader(path)
+    grid = {}
+    grid['token'], grid['version'] = br.read('I'), br.read('I')
+    grid['west'], grid['east'], grid['north'], grid['south'] = br.read('dddd')
+    categoriesCount = br.read('i')
+    grid['minValue'], grid['maxValue'] = br.read('f'), br.read('f')
+    grid['countX'], grid['countY'] = br.read('i'), br.read('i')
+    grid['units'] = br.readString()
+    grid['coloring'] = br.read('B')
+    grid['metadata'] = [(br.readString(), br.readString()) for i in range(br.read('i'))]
+    grid['categories'] = [(br.readString(), br.read('i')) for i in range(categoriesCount)]
+    count = grid['countX'] * grid['countY']
+    grid['values'] = br.readArray('<f4', count)
+    grid['mask'] = br.readArray('u1', 4 * ((count + 3) // 4)) if br.read('?') else None
+    distributionCount = br.read('B')
+    grid['distribution'] = br.readArray('<i4', distributionCount) if distributionCount > 0 else None
+    grid['maxDistribution'] = br.read('i') if distributionCount > 0 else None
+    grid['isAtEnd'] = br.isAtEnd()
+    return grid
+
+def dotNetString(text):
+    """ string as a .NET BinaryWriter writes it: 7 bit encoded length of the utf-8 bytes, then the bytes"""
+    encoded = text.encode('utf-8')
+    length, prefix = len(encoded), b''
+    while length >= 0x80:
+        prefix += bytes([(length & 0x7F) | 0x80])
+        length >>= 7
+    return prefix + bytes([length]) + encoded
+
+def expectedBin(extent, minValue, maxValue, countX, countY, units, metadata, categories, values, mask, distribution):
+    """ bytes GridDataIO.SaveBin (WriteBinHeader, WriteBinProperties and WriteBinValues)
+    writes for the given grid, built from the test inputs and not from the written file"""
+    data = struct.pack('<IIdddd', 0x600DF00D, 13, *extent)
+    data += struct.pack('<iffii', len(categories), minValue, maxValue, countX, countY)
+    data += dotNetString(units) + struct.pack('<B', 2) # GridData.Coloring.Multi
+    data += struct.pack('<i', len(metadata)) + b''.join(dotNetString(key) + dotNetString(value) for key, value in metadata)
+    data += b''.join(dotNetString(categoryName) + struct.pack('<i', i) for i, categoryName in enumerate(categories))
+    data += numpy.asarray(values, dtype='<f4').tobytes()
+    data += struct.pack('<?', mask is not None)
+    if mask is not None:
+        mask = numpy.asarray(mask, dtype='u1')
+        data += mask.tobytes() + bytes(4 * ((mask.size + 3) // 4) - mask.size) # GridData.CreateMaskBuffer
+    if distribution is None:
+        data += struct.pack('<B', 0)
+    else:
+        data += struct.pack('<B', len(distribution)) + numpy.asarray(distribution, dtype='<i4').tobytes() + struct.pack('<i', max(distribution))
+    return data
+
+def updateDistribution(values, mask, minValue, maxValue):
+    """ GridData.UpdateDistribution as run after loading a csv patch"""
+    minValue, maxValue = numpy.float32(minValue), numpy.float32(maxValue)
+    distributionSize = 50
+    valueRange = 1 + int(maxValue - minValue)
+    if 2 < valueRange <= 20 and minValue == math.floor(minValue) and maxValue == math.floor(maxValue):
+        distributionSize = valueRange
+    invValueRange = numpy.float32(0)
+    if abs(maxValue - minValue) > 0.0001:
+        invValueRange = numpy.float32(distributionSize - 1) / (maxValue - minValue)
+    distribution = [0] * distributionSize
+    for value, isValid in zip(values, mask):
+        if isValid:
+            distribution[int((value - minValue) * invValueRange + numpy.float32(0.5))] += 1
+    return distribution
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class GridBinTest(unittest.TestCase):
+    "Patches written by writeGridToBin must be read back by GridDataIO.ParseBin"
+
+    citation = "Statistics Bureau (2020), population census ré-sampled to the grid,\nwith a citation longer than 127 bytes so its length takes two bytes in the .NET string"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        for key, value in (('name', "Population Density"), ('location', "Palembang"), ('date', "2020"),
+                           ('onlyYear', False), ('resolution', "1"), ('units', "People per Sq km"),
+                           ('source', "Statistics Bureau"), ('citation', self.citation), ('mandatoryCitation', False),
+                           ('link', "https://example.org/census"), ('extentAsCanvas', False),
+                           ('workingPrecision', "Float32"), ('writeBlockSize', 6), ('outputFormat', "bin")):
+            setGlobal(self, q2u, key, value)
+        self.setup = object.__new__(q2u.Setup)
+        self.setup.finalPath = self.folder
+        self.setup.isCategorized = False
+        self.setup.isPoint = False
+        self.setup.categories = []
+        self.setup.units = "People per Sq km"
+
+    def writePatch(self, values):
+        path = os.path.join(self.folder, "patch.tif")
+        ds = q2u.gdal.GetDriverByName('GTiff').Create(path, values.shape[1], values.shape[0], 1, q2u.gdal.GDT_Float32)
+        ds.SetGeoTransform((106.0, 0.001, 0, -6.0, 0, -0.001))
+        ds.GetRasterBand(1).WriteArray(values)
+        ds.GetRasterBand(1).SetNoDataValue(-9999.0)
+        ds.FlushCache()
+        ds = None
+
+        countY, countX = values.shape
+        patch = q2u.PatchBand(path, (0, 0, countX, countY), countX, countY, None, 'f4')
+        writer = object.__new__(q2u.FileWriter)
+        extent = q2u.QgsRectangle(106.0, -6.0 - 0.001 * countY, 106.0 + 0.001 * countX, -6.0)
+        writer.writeGridToBin(0, self.setup, extent, patch)
+        files = glob.glob(os.path.join(self.folder, "*.bin"))
+        self.assertEqual([os.path.basename(file) for file in files], ["Population Density_D_Palembang@0_2020_grid.bin"])
+        return files[0]
+
+    def assertFileBytes(self, path, expected):
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), expected)
+
+    def testValuesWithNoData(self):
+        values = numpy.array([[1.5, 2.25, -9999, 4.0, 5.0],
+                              [6.0, -9999, 8.0, 9.5, 10.0],
+                              [11.0, 12.0, 13.0, -9999, 1000.125]], dtype='f4')
+        path = self.writePatch(values)
+        isValid = values.ravel() != -9999
+        metadata = [("Layer Name", "Population Density"), ("Source", "Statistics Bureau"),
+                    ("Citation", self.citation.replace('\n', ' ')), ("Link", "https://example.org/census")]
+        validValues = numpy.where(isValid, values.ravel(), 0)
+        distribution = updateDistribution(validValues, isValid, 1.5, 1000.125)
+        self.assertFileBytes(path, expectedBin((106.0, 106.005, -6.0, -6.003), 1.5, 1000.125, 5, 3, "People per Sq km",
+                                               metadata, [], validValues, isValid, distribution))
+
+        grid = parseBin(path)
+        self.assertTrue(grid['isAtEnd'])
+        self.assertEqual((grid['token'], grid['version']), (0x600DF00D, 13))
+        self.assertEqual((grid['west'], grid['east'], grid['north'], grid['south']), (106.0, 106.005, -6.0, -6.003))
+        self.assertEqual((grid['minValue'], grid['maxValue']), (1.5, 1000.125))
+        self.assertEqual((grid['countX'], grid['countY']), (5, 3))
+        self.assertEqual(grid['units'], "People per Sq km")
+        self.assertEqual(grid['coloring'], 2) # GridData.Coloring.Multi
+        self.assertEqual(grid['metadata'], metadata)
+        self.assertEqual(grid['categories'], [])
+
+        numpy.testing.assert_array_equal(grid['values'], validValues)
+        numpy.testing.assert_array_equal(grid['mask'], numpy.concatenate((isValid, [False])).astype('u1'))
+        self.assertEqual(grid['distribution'].tolist(), distribution)
+        self.assertEqual(grid['maxDistribution'], max(distribution))
+
+    def testValuesWithoutNoData(self):
+        values = numpy.arange(1, 13, dtype='f4').reshape(3, 4)
+        path = self.writePatch(values)
+        metadata = [("Layer Name", "Population Density"), ("Source", "Statistics Bureau"),
+                    ("Citation", self.citation.replace('\n', ' ')), ("Link", "https://example.org/census")]
+        self.assertFileBytes(path, expectedBin((106.0, 106.004, -6.0, -6.003), 1.0, 12.0, 4, 3, "People per Sq km",
+                                               metadata, [], values.ravel(), None, [1] * 12))
+
+        grid = parseBin(path)
+        self.assertTrue(grid['isAtEnd'])
+
+        self.assertEqual((grid['minValue'], grid['maxValue']), (1.0, 12.0))
+        numpy.testing.assert_array_equal(grid['values'], values.ravel())
+        self.assertIsNone(grid['mask'])
+        self.assertEqual(grid['distribution'].tolist(), [1] * 12) # integer range of 12 gets 12 bins
+        self.assertEqual(grid['maxDistribution'], 1)
+
+    def testCategories(self):
+        self.setup.isCategorized = True
+        self.setup.categories = ["Water", "Forest", "Urban"]
+        setGlobal(self, q2u, 'mandatoryCitation', True)
+        values = numpy.array([[1, 2, 3], [-9999, 7, 2]], dtype='f4')
+        path = self.writePatch(values)
+        metadata = [("Layer Name", "Population Density"), ("Source", "Statistics Bureau"),
+                    ("MandatoryCitation", self.citation.replace('\n', ' ')), ("Link", "https://example.org/census")]
+        self.assertFileBytes(path, expectedBin((106.0, 106.003, -6.0, -6.002), 0.0, 2.0, 3, 2, "",
+                                               metadata, ["Water", "Forest", "Urban"], [0, 1, 2, 0, -1, 1], [1, 1, 1, 0, 1, 1], None))
+
+        grid = parseBin(path)
+        self.assertTrue(grid['isAtEnd'])
+
+        self.assertEqual(grid['categories'], [("Water", 0), ("Forest", 1), ("Urban", 2)])
+        self.assertEqual((grid['minValue'], grid['maxValue']), (0.0, 2.0))
+        self.assertEqual(grid['units'], "")
+        self.assertEqual(grid['metadata'][2][0], "MandatoryCitation")
+        # ids 1..n are stored as 0..n-1 and unknown ids as -1, -2, ... (GridData.RemapCategories)
+        numpy.testing.assert_array_equal(grid['values'], [0, 1, 2, 0, -1, 1])
+        numpy.testing.assert_array_equal(grid['mask'], [1, 1, 1, 0, 1, 1, 0, 0])
+        self.assertIsNone(grid['distribution'])
+
+if __name__ == "__main__":
+    unittest.main()
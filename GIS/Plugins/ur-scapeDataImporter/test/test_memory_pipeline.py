@@ -0,0 +1,127 @@
+import math, os, shutil, tempfile, unittest
+import numpy
+from utilities import getExporter, setGlobal
+
+q2u = getExporter()
+if q2u is not None:
+    from qgis.core import QgsFeature, QgsGeometry
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class MemoryPipelineTest(unittest.TestCase):
+    "Intermediate rasters of the in-memory pipeline are budgeted once per path"
+
+    def setUp(self):
+        setGlobal(self, q2u, 'inMemoryPipeline', True)
+        setGlobal(self, q2u, 'inMemoryLimitMb', 1)
+        self.layer = object.__new__(q2u.CheckLayer)
+        self.layer.memoryFiles = {}
+        self.layer.memorySize = 0
+
+    def testSameNameCountedOnce(self):
+        """ rasterToGraph makes Agregated_Raster.tif for each road class"""
+        for i in range(5):
+            self.assertEqual(self.layer.getTempPath("Agregated_Raster.tif", 400000, 'u1'), "/vsimem/Agregated_Raster.tif")
+        self.assertEqual(self.layer.memorySize, 400000)
+        self.assertEqual(list(self.layer.memoryFiles), ["/vsimem/Agregated_Raster.tif"])
+        self.assertEqual(self.layer.getTempPath("Other.tif", 600000, 'u1'), "/vsimem/Other.tif")
+
+    def testReplacedRasterSize(self):
+        self.layer.getTempPath("Raster.tif", 1000, 'f8')
+        self.layer.getTempPath("Raster.tif", 1000, 'f4')
+        self.assertEqual(self.layer.memorySize, 4000)
+
+    def testLimit(self):
+        self.layer.getTempPath("First.tif", 1000000, 'u1')
+        self.assertFalse(self.layer.getTempPath("Second.tif", 100000, 'u1').startswith('/vsimem/'))
+        self.assertEqual(self.layer.memorySize, 1000000)
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class RasterizeInProcessTest(unittest.TestCase):
+    "Rasters in GDAL memory are rasterized in process as gdal:rasterize does"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.layer = q2u.QgsVectorLayer("Polygon?crs=EPSG:4326&field=value:double", "polygons", "memory")
+        features = []
+        for wkt, value in (("POLYGON((106 -6, 106.004 -6, 106.004 -6.003, 106 -6.003, 106 -6))", 2.5),
+                           ("POLYGON((106.006 -6.001, 106.009 -6.001, 106.009 -6.005, 106.006 -6.005, 106.006 -6.001))", None)):
+            feature = QgsFeature(self.layer.fields())
+            feature.setGeometry(QgsGeometry.fromWkt(wkt))
+            feature.setAttribute('value', value)
+            features.append(feature)
+        self.layer.dataProvider().addFeatures(features)
+        self.extent = q2u.QgsRectangle(105.999, -6.006, 106.010, -5.999)
+
+    def testSameAsProcessing(self):
+        path = "/vsimem/rasterized.tif"
+        self.addCleanup(q2u.gdal.Unlink, path)
+        layer = object.__new__(q2u.CheckLayer)
+        layer.rasterizeInProcess(self.layer, 'value', self.extent, 0.001, q2u.gdal.GDT_Float32, path)
+
+        expectedPath = os.path.join(self.folder, "rasterized.tif")
+        q2u.processing.run("gdal:rasterize", {'INPUT': self.layer, 'FIELD': 'value', 'UNITS': 1, 'WIDTH': 0.001, 'HEIGHT': 0.001,
+                                              'EXTENT': self.extent, 'DATA_TYPE': 5, 'INVERT': False, 'INIT': float('nan'),
+                                              'OUTPUT': expectedPath})
+        result, expected = q2u.gdal.Open(path), q2u.gdal.Open(expectedPath)
+        self.assertEqual(result.GetGeoTransform(), expected.GetGeoTransform())
+        values = result.ReadAsArray()
+        numpy.testing.assert_array_equal(values, expected.ReadAsArray())
+        self.assertEqual(sorted(set(values[~numpy.isnan(values)].tolist())), [0.0, 2.5]) # NULL is burnt as 0
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class NoDataVrtTest(unittest.TestCase):
+    "processNoData keeps the values of the materialized copy when it uses a VRT"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        for key, value in (('inMemoryPipeline', True), ('inMemoryLimitMb', 64), ('virtualNoData', True),
+                           ('workingPrecision', "Float32"), ('name', "noData"), ('useBand', 1)):
+            setGlobal(self, q2u, key, value)
+        self.layer = object.__new__(q2u.CheckLayer)
+        self.layer.memoryFiles = {}
+        self.layer.memorySize = 0
+        self.addCleanup(lambda: [q2u.gdal.Unlink(path) for path in self.layer.memoryFiles])
+        self.setup = object.__new__(q2u.Setup)
+        self.setup.isCategorized = False
+        self.setup.isPoint = False
+        self.values = numpy.array([[1.5, float('nan'), 3.0, -9999], [5.0, -9999, 7.25, 8.0], [float('nan'), 10.0, 11.0, 12.0]], dtype='f4')
+
+    def createRaster(self, bandNoData):
+        path = os.path.join(self.folder, "input.tif")
+        ds = q2u.gdal.GetDriverByName('GTiff').Create(path, 4, 3, len(bandNoData), q2u.gdal.GDT_Float32)
+        ds.SetGeoTransform((106.0, 0.001, 0, -6.0, 0, -0.001))
+        for bandIndex, noData in enumerate(bandNoData, 1):
+            ds.GetRasterBand(bandIndex).WriteArray(self.values)
+            ds.GetRasterBand(bandIndex).SetNoDataValue(noData)
+        ds = None
+        return path
+
+    def processNoData(self, path, noDataList):
+        self.setup.noDataList = noDataList
+        result = self.layer.processNoData(self.setup, path)
+        band = q2u.gdal.Open(result).GetRasterBand(1)
+        return result, q2u.readAsFloat(band, 0, 0, 4, 3, 'f4')
+
+    def testNaNNoDataIsMaterialized(self):
+        path = self.createRaster([float('nan')])
+        result, values = self.processNoData(path, [float('nan'), -9999.0])
+        self.assertFalse(result.endswith('.vrt'))
+        self.assertTrue(math.isnan(q2u.gdal.Open(result).GetRasterBand(1).GetNoDataValue()))
+        expected = self.layer.materializeNoData([-9999.0], path, "expected_", ".tif", q2u.gdal.GDT_Float32, 'f4')
+        numpy.testing.assert_array_equal(values, q2u.gdal.Open(expected).ReadAsArray())
+        numpy.testing.assert_array_equal(numpy.isnan(values), numpy.isnan(self.values) | (self.values == -9999))
+
+    def testBandNoDataNotUniformIsMaterialized(self):
+        result, values = self.processNoData(self.createRaster([-9999.0, 1.5]), [-9999.0])
+        self.assertFalse(result.endswith('.vrt'))
+        numpy.testing.assert_array_equal(numpy.isnan(values), numpy.isnan(self.values) | (self.values == -9999))
+
+    def testSingleNoDataIsVirtual(self):
+        result, values = self.processNoData(self.createRaster([-9999.0]), [-9999.0])
+        self.assertTrue(result.endswith('.vrt'))
+        numpy.testing.assert_array_equal(numpy.isnan(values), numpy.isnan(self.values) | (self.values == -9999))
+
+if __name__ == "__main__":
+    unittest.main()
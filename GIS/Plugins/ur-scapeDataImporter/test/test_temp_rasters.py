@@ -0,0 +1,37 @@
+import unittest
+from utilities import getExporter, setGlobal
+
+q2u = getExporter()
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class CreationOptionsTest(unittest.TestCase):
+    "Temp GeoTIFFs are tiled and compressed with a predictor for the data type"
+
+    def setUp(self):
+        self.layer = object.__new__(q2u.CheckLayer)
+        self.hasZstd = 'ZSTD' in (q2u.gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST') or '')
+
+    def testDefaultCompression(self):
+        compression = 'COMPRESS=' + ('ZSTD' if self.hasZstd else 'DEFLATE')
+        for gdalType, predictor in ((q2u.gdal.GDT_Float32, 'PREDICTOR=3'), (q2u.gdal.GDT_Float64, 'PREDICTOR=3'),
+                                    (q2u.gdal.GDT_Byte, 'PREDICTOR=2'), (q2u.gdal.GDT_Int32, 'PREDICTOR=2')):
+            with self.subTest(gdalType=gdalType):
+                options = self.layer.getCreationOptions(gdalType)
+                self.assertIn('TILED=YES', options)
+                self.assertIn(compression, options)
+                self.assertIn(predictor, options)
+
+    def testNoCompression(self):
+        setGlobal(self, q2u, 'tempCompression', "NONE")
+        options = self.layer.getCreationOptions(q2u.gdal.GDT_Float32)
+        self.assertFalse([option for option in options if option.startswith(('COMPRESS=', 'PREDICTOR='))])
+
+    def testPerformanceProfileCompressesWarps(self):
+        setGlobal(self, q2u, 'performanceProfile', True)
+        setGlobal(self, q2u, 'tempCompression', "NONE")
+        options = self.layer.getWarpParameters()['OPTIONS'].split('|')
+        self.assertIn('COMPRESS=' + ('ZSTD' if self.hasZstd else 'DEFLATE'), options)
+        self.assertIn('PREDICTOR=3', options)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import io, os, shutil, tempfile, unittest
+import numpy
+from utilities import getExporter, setGlobal
+
+q2u = getExporter()
+
+@unittest.skipIf(q2u is None, "QGIS and GDAL are needed")
+class WorkingPrecisionTest(unittest.TestCase):
+    "Continuous layers use the working precision, municipal budget and category values must not be rounded by it"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        setGlobal(self, q2u, 'workingPrecision', "Float32")
+        self.setup = object.__new__(q2u.Setup)
+        self.setup.isCategorized = False
+        self.setup.isPoint = False
+
+    def createRaster(self, values):
+        path = os.path.join(self.folder, "layer.tif")
+        ds = q2u.gdal.GetDriverByName('GTiff').Create(path, values.shape[1], values.shape[0], 1, q2u.gdal.GDT_Float64)
+        ds.SetGeoTransform((106.0, 0.001, 0, -6.0, 0, -0.001))
+        ds.GetRasterBand(1).WriteArray(values)
+        ds.GetRasterBand(1).SetNoDataValue(-9999.0)
+        ds.FlushCache()
+        ds = None
+        return path
+
+    def exportValues(self, path, countX, countY):
+        patch = q2u.PatchBand(path, (0, 0, countX, countY), countX, countY, None, self.setup.getWorkingPrecision()[1])
+        writer = object.__new__(q2u.FileWriter)
+        output = io.StringIO()
+        for yStart, values, masks in patch.blocks():
+            writer.writeValuesBlock(output, values, masks)
+        return output.getvalue().splitlines()
+
+    def testMunicipalBudgetIsFloat64(self):
+        setGlobal(self, q2u, 'forMunicipalBudget', True)
+        self.assertEqual(self.setup.getWorkingPrecision(), (q2u.gdal.GDT_Float64, 'f8'))
+
+    def testCategoriesAreFloat64(self):
+        self.setup.isCategorized = True
+        self.assertEqual(self.setup.getWorkingPrecision(), (q2u.gdal.GDT_Float64, 'f8'))
+        self.setup.isPoint = True
+        self.assertEqual(self.setup.getWorkingPrecision(), (q2u.gdal.GDT_Float32, 'f4'))
+
+    def testMunicipalBudgetValuesAreExact(self):
+        setGlobal(self, q2u, 'forMunicipalBudget', True)
+        values = numpy.array([[16777217, 123456789, 2147483647], [0, -9999, 7]], dtype=float)
+        lines = self.exportValues(self.createRaster(values), 3, 2)
+        self.assertEqual(lines, ["16777217", "123456789", "2147483647", "-1", "-1", "7"])
+
+    def readValues(self, path):
+        ds = q2u.gdal.Open(path)
+        return q2u.readAsFloat(ds.GetRasterBand(1), 0, 0, ds.RasterXSize, ds.RasterYSize, self.setup.getWorkingPrecision()[1])
+
+    def testMunicipalBudgetIsReadAsFloat64(self):
+        setGlobal(self, q2u, 'forMunicipalBudget', True)
+        values = numpy.array([[16777217, 123456789, 2147483647], [0, -9999, 7]], dtype=float)
+        data = self.readValues(self.createRaster(values))
+        self.assertEqual(data.dtype, numpy.float64)
+        numpy.testing.assert_array_equal(data, numpy.where(values == -9999, numpy.nan, values))
+
+    def testContinuousLayerIsFloat32(self):
+        """ an ordinary continuous layer is read, kept in temp rasters and
+        exported in Float32, values in the csv are within one Float32 step
+        (relative 2^-23) of the input"""
+        self.assertEqual(self.setup.getWorkingPrecision(), (q2u.gdal.GDT_Float32, 'f4'))
+        values = numpy.array([[0.1, 1234.5678, 3.14159265358979], [-9999, 98765432.1, 1e-7]])
+        path = self.createRaster(values)
+        data = self.readValues(path)
+        self.assertEqual(data.dtype, numpy.float32)
+
+        lines = self.exportValues(path, 3, 2)
+        self.assertEqual(lines[0], "0.1,1") # shortest Float32 form
+        self.assertEqual(lines[3], "0,0")
+        exported = numpy.array([float(line.split(',')[0]) for line in lines]).reshape(2, 3)
+        isValid = values != -9999
+        numpy.testing.assert_allclose(exported[isValid], values[isValid], rtol=2.0**-23)
+        self.assertFalse(numpy.array_equal(exported[isValid], values[isValid]))
+
+    def testTempRasterSize(self):
+        """ intermediate rasters are budgeted with the size of the working precision"""
+        setGlobal(self, q2u, 'inMemoryPipeline', True)
+        layer = object.__new__(q2u.CheckLayer)
+        layer.memoryFiles = {}
+        layer.memorySize = 0
+        layer.getTempPath("continuous.tif", 1000, self.setup.getWorkingPrecision()[1])
+        self.assertEqual(layer.memorySize, 4000)
+        setGlobal(self, q2u, 'forMunicipalBudget', True)
+        layer.getTempPath("budget.tif", 1000, self.setup.getWorkingPrecision()[1])
+        self.assertEqual(layer.memorySize, 12000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Helpers to run the tests with the QGIS python (e.g. python -m unittest discover test)"""
+import os, sys, struct
+import numpy
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QGIS_APP = None
+
+def getExporter():
+    """ import qgis2urscape with a headless QGIS application, None when QGIS
+    or GDAL are not available"""
+    global QGIS_APP
+    try:
+        from qgis.core import QgsApplication
+    except ImportError:
+        return None
+    if QGIS_APP is None:
+        QGIS_APP = QgsApplication([], False)
+        QGIS_APP.initQgis()
+        sys.path.append(os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins')) # processing
+    if PLUGIN_DIR not in sys.path:
+        sys.path.insert(0, PLUGIN_DIR)
+    import qgis2urscape
+    return qgis2urscape
+
+def setGlobal(testCase, module, name, value):
+    """ set a setup variable of the module for one test"""
+    testCase.addCleanup(setattr, module, name, getattr(module, name))
+    setattr(module, name, value)
+
+class BinaryReader:
+    "Reads a file as the .NET BinaryReader used by the ur-scape *DataIO classes"
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        self.position = 0
+
+    def read(self, fmt):
+        values = struct.unpack_from('<' + fmt, self.data, self.position)
+        self.position += struct.calcsize('<' + fmt)
+        return values[0] if len(values) == 1 else values
+
+    def readString(self):
+        """ 7 bit encoded length of the utf-8 bytes, then the bytes"""
+        length = shift = 0
+        while True:
+            byte = self.read('B')
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        text = self.data[self.position:self.position + length].decode('utf-8')
+        self.position += length
+        return text
+
+    def readArray(self, dtype, count):
+        values = numpy.frombuffer(self.data, dtype=dtype, count=count, offset=self.position)
+        self.position += values.nbytes
+        return values
+
+    def isAtEnd(self):
+        return self.position == len(self.data)